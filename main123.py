@@ -9,6 +9,17 @@ r"""
 - H.264+AAC 선호, 불가 시 자동 폴백(필요 시 재인코딩) → mp4 보장
 - 중복 파일 자동 넘버링 / 완료 후 실제 파일 검증(보강: 생성된 파일을 우선 신뢰)
 - 폴더 열기 / 마지막 저장 폴더 기억 (APPDATA\ArangYTDownloader\config.json)
+- 대역폭 스케줄러: 전역 상한/작업별 한도/우선순위/시간대별 상한 (config.json의 "bandwidth")
+- 무결성: 받는 동안 sha256 계산, ffprobe로 길이/스트림 검증, 실패한 단계(다운로드/후처리)만 재시도
+- URL이 보이면(클립보드/입력) 메타데이터를 미리 읽어 제목/길이/예상 크기 표시, 다운로드 때 재사용
+- 시작 전 예상 용량(원본+병합+변환 중간 파일) 추정, 디스크 여유가 생길 때까지 작업 대기
+- 작업 스레드 풀(config.json의 "workers"): 스레드마다 쿠키 jar/HTTP 연결을 작업 간에 재사용
+- 스트림 캐시: 받아 둔 원본 트랙을 (영상 ID, 포맷 ID)로 보관 → 폴백/다음 작업에서 재다운로드 없이 후처리만
+- 로컬 파생: 이미 받은 영상은 네트워크 없이 음성 추출/해상도 축소(archive.json), 폴더 일괄 변환(프로세스 풀)
+- 분산 작업자: --store 공유 SQLite 대기열을 여러 PC가 임대/하트비트로 나눠 처리(--worker, --submit)
+- 청크 헤지: 최근 청크 소요 시간보다 한참 늦는 Range 요청은 한 번 더 보내 먼저 끝난 쪽 사용(횟수 제한)
+- 프로파일링: --profile 또는 YTDL_PROFILE로 작업별 보고서(cProfile, 스택 샘플, tracemalloc, ffmpeg CPU), --profile-compare로 비교
+- 누수 점검: --soak N 으로 가짜 미디어 서버에 합성 작업 N개를 돌려 RSS/스레드/fd/대기열이 계속 늘면 실패
 """
 
 import sys, subprocess, importlib
@@ -32,10 +43,17 @@ except Exception:
     pyperclip = None
 
 # ------------------------ 표준 라이브러리 ------------------------
-import os, re, threading, queue, traceback, json, webbrowser, shutil
+import os, re, io, copy, time, hashlib, functools, contextlib, threading, queue, traceback, json, webbrowser, shutil
+import multiprocessing, concurrent.futures, socket, sqlite3, argparse, cProfile, pstats, tracemalloc, tempfile
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+from collections import OrderedDict, Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 from yt_dlp import YoutubeDL
+from yt_dlp.cookies import YoutubeDLCookieJar
+from yt_dlp.networking import Response
+from yt_dlp.networking.exceptions import IncompleteRead
+from yt_dlp.utils import parse_http_range, int_or_none, prepend_extension
 
 YOUTUBE_REGEX = re.compile(r'(https?://)?(www\.)?(youtube\.com|youtu\.be)/')
 
@@ -46,25 +64,32 @@ def get_config_path():
     os.makedirs(cfg_dir, exist_ok=True)
     return os.path.join(cfg_dir, "config.json")
 
-def load_last_dir():
+def load_config() -> dict:
     try:
         path = get_config_path()
         if os.path.exists(path):
             with open(path, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            d = data.get("last_dir", "")
-            if d and os.path.isdir(d):
-                return d
+            if isinstance(data, dict):
+                return data
     except Exception:
         pass
+    return {}
+
+def load_last_dir():
+    d = load_config().get("last_dir", "")
+    if d and os.path.isdir(d):
+        return d
     dfl = os.path.join(os.path.expanduser("~"), "Downloads")
     return dfl if os.path.isdir(dfl) else ""
 
 def save_last_dir(d):
     try:
+        data = load_config()
+        data["last_dir"] = d
         path = get_config_path()
         with open(path, "w", encoding="utf-8") as f:
-            json.dump({"last_dir": d}, f, ensure_ascii=False, indent=2)
+            json.dump(data, f, ensure_ascii=False, indent=2)
     except Exception:
         pass
 
@@ -117,6 +142,255 @@ def find_cookie_file():
             return p
     return None
 
+# ---------- 느린 청크/조각 요청 헤지 ----------
+HEDGE_MAX_BYTES = 16 * 1024 * 1024   # 이보다 큰(또는 끝이 열린) Range 요청은 그대로 흘려보냄
+HEDGE_MIN_SEC = 2.0
+HEDGE_MAX_SEC = 30.0
+HEDGE_DEFAULT_SEC = 10.0             # 소요 시간 표본이 모이기 전의 마감 시간
+HEDGE_FACTOR = 2.0                   # 최근 청크 p90 소요 시간의 몇 배를 넘기면 멈춘 것으로 볼지
+HEDGE_RATIO = 0.05                   # 청크 요청 대비 중복 요청 상한(과하면 YouTube 스로틀)
+HEDGE_BURST = 2                      # 동시에 떠 있을 수 있는 중복 요청 수
+
+class HedgePolicy:
+    """최근 청크 소요 시간(바이트당)으로 마감 시간을 정하고 중복 요청 수를 제한. 엔진 전체가 공유"""
+    def __init__(self, on_hedge=None):
+        self.lock = threading.Lock()
+        self.samples = deque(maxlen=64)   # 초/바이트
+        self.requests = 0
+        self.hedges = 0
+        self.inflight = 0
+        self.wins = 0                     # 중복 요청이 먼저 끝난 횟수
+        self.on_hedge = on_hedge
+
+    def deadline(self, size):
+        with self.lock:
+            if len(self.samples) < 5:
+                return HEDGE_DEFAULT_SEC
+            p90 = sorted(self.samples)[int(len(self.samples) * 0.9)]
+        return min(HEDGE_MAX_SEC, max(HEDGE_MIN_SEC, p90 * size * HEDGE_FACTOR))
+
+    def record(self, size, secs, hedged):
+        with self.lock:
+            self.samples.append(secs / max(size, 1))
+            self.wins += hedged
+
+    def begin(self):
+        with self.lock:
+            self.requests += 1
+
+    def acquire(self) -> bool:
+        with self.lock:
+            if self.inflight >= HEDGE_BURST or self.hedges >= HEDGE_BURST + HEDGE_RATIO * self.requests:
+                return False
+            self.hedges += 1
+            self.inflight += 1
+            return True
+
+    def release(self, _fut=None):
+        with self.lock:
+            self.inflight -= 1
+
+class HedgedDirector:
+    """
+    yt-dlp RequestDirector 감싸기. 끝이 정해진 Range 요청(http_chunk_size 청크, DASH 조각)은
+    본문까지 받아 두고, 마감 시간 안에 끝나지 않으면 같은 요청을 한 번 더 보내 먼저 끝난 쪽을 씀.
+    서버가 Range를 무시하고 200 전체 응답을 주거나 길이가 크거나 모르면 메모리에 담지 않고 그대로 흘려보냄.
+    """
+    def __init__(self, inner, policy: HedgePolicy):
+        self.inner = inner
+        self.policy = policy
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers=6, thread_name_prefix="hedge")
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    def close(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+        self.inner.close()
+
+    def send(self, request):
+        start, end, _ = parse_http_range(request.headers.get("Range"))
+        if request.method != "GET" or start is None or end is None or end - start + 1 > HEDGE_MAX_BYTES:
+            return self.inner.send(request)
+        size = end - start + 1
+        self.policy.begin()
+        stop = threading.Event()
+        t0 = time.monotonic()
+        primary = self.pool.submit(self._fetch, request.copy(), stop)
+        pending = {primary}
+        if not concurrent.futures.wait(pending, timeout=self.policy.deadline(size))[0] and self.policy.acquire():
+            if self.policy.on_hedge:
+                self.policy.on_hedge(time.monotonic() - t0)
+            hedge = self.pool.submit(self._fetch, request.copy(), stop)
+            hedge.add_done_callback(self.policy.release)
+            pending.add(hedge)
+        error, winner, started = None, None, set(pending)
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for fut in done:
+                    try:
+                        resp, body, secs = fut.result()
+                    except Exception as e:
+                        error = error or e
+                        continue
+                    winner = fut
+                    if body is None:
+                        return resp
+                    self.policy.record(size, secs, fut is not primary)
+                    return Response(io.BytesIO(body), resp.url, resp.headers, resp.status, resp.reason)
+            raise error
+        finally:
+            stop.set()   # 진 쪽은 다음 블록에서 연결을 닫고 끝남
+            for fut in started - {winner}:
+                fut.add_done_callback(self._discard)
+
+    @staticmethod
+    def _discard(fut):
+        """진 쪽이 흘려보낼 응답(본문을 안 담은 것)을 들고 끝났으면 닫음"""
+        try:
+            resp, body, _ = fut.result()
+        except Exception:
+            return
+        if body is None:
+            resp.close()
+
+    def _fetch(self, request, stop):
+        t0 = time.monotonic()
+        resp = self.inner.send(request)
+        expected = int_or_none(resp.headers.get("Content-Length"))
+        if resp.status != 206 or expected is None or expected > HEDGE_MAX_BYTES:
+            return resp, None, time.monotonic() - t0   # 본문은 호출한 쪽이 직접 읽음
+        buf = bytearray()
+        try:
+            while not stop.is_set():
+                block = resp.read(256 * 1024)
+                if not block:
+                    break
+                buf += block
+        finally:
+            resp.close()
+        if len(buf) < expected:
+            raise IncompleteRead(len(buf), expected - len(buf))
+        return resp, bytes(buf), time.monotonic() - t0
+
+# ---------- 쿠키/HTTP 세션 공유 ----------
+def _cookie_marks(jar) -> set:
+    return {(c.domain, c.path, c.name, c.value, c.expires) for c in jar}
+
+class CookieStore:
+    """
+    cookies.txt를 한 번만 읽어 모든 작업이 하나의 jar를 공유.
+    - 파일이 없어도 같은 메모리 jar를 공유(extractor가 심은 SOCS/PREF/방문자 쿠키가 실제 요청에 실리도록)
+    - 파일 mtime이 바뀌었을 때만 다시 읽음(같은 jar 객체에 다시 채움)
+    - 갱신된 쿠키는 잠금 파일 + 임시 파일 교체로 안전하게 되씀
+      (다른 작업/프로세스가 먼저 쓴 내용은 읽어 와서 합친 뒤 저장)
+    """
+    RELOCATE_SEC = 30   # 쿠키 파일이 없을 때 다시 찾아보는 간격
+    LOCK_STALE_SEC = 30
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.path = None
+        self.mtime = None
+        self.jar = YoutubeDLCookieJar()
+        self.marks = set()
+        self.located_at = 0.0
+
+    def locate(self):
+        with self.lock:
+            if self.path and os.path.isfile(self.path):
+                return self.path
+            if time.monotonic() - self.located_at >= self.RELOCATE_SEC or self.path:
+                self.path, self.located_at = find_cookie_file(), time.monotonic()
+            return self.path
+
+    def get(self):
+        """공유 jar(쿠키 파일이 없으면 파일 없이 메모리에서만 유지되는 같은 jar)"""
+        with self.lock:
+            path = self.locate()
+            if not path:
+                return self.jar
+            try:
+                mtime = os.path.getmtime(path)
+                if mtime != self.mtime:
+                    self.jar.clear()
+                    self.jar.load(path)
+                    self.mtime, self.marks = mtime, _cookie_marks(self.jar)
+            except Exception:
+                pass
+            return self.jar
+
+    def save(self):
+        """작업 중 바뀐 쿠키가 있으면 cookies.txt에 되씀"""
+        with self.lock:
+            if not self.path or _cookie_marks(self.jar) == self.marks:
+                return
+            try:
+                with file_lock(self.path, self.LOCK_STALE_SEC):
+                    if os.path.getmtime(self.path) != self.mtime:
+                        # 그 사이 다른 쪽이 저장함 → 파일 내용 위에 우리 쿠키를 덮어 합침
+                        disk = YoutubeDLCookieJar()
+                        disk.load(self.path)
+                        for c in disk:
+                            if (c.domain, c.path, c.name) not in {(x.domain, x.path, x.name) for x in self.jar}:
+                                self.jar.set_cookie(c)
+                    tmp = f"{self.path}.{os.getpid()}.tmp"
+                    self.jar.save(tmp)
+                    os.replace(tmp, self.path)
+                    self.mtime, self.marks = os.path.getmtime(self.path), _cookie_marks(self.jar)
+            except Exception:
+                pass
+
+class WorkerSession:
+    """
+    작업 스레드 하나가 폴백 시도와 여러 작업에 걸쳐 계속 쓰는 yt-dlp 네트워크 계층.
+    YoutubeDL마다 공유 쿠키 jar와 같은 RequestDirector(연결 풀/TLS 세션)를 꽂아 줌.
+    hedge를 주면 멈춘 청크 요청을 중복 요청으로 우회(HedgedDirector).
+    선읽기처럼 여러 스레드가 동시에 open()해도 되도록, 교체된 director는 마지막 사용자가 끝난 뒤에 닫음.
+    """
+    def __init__(self, cookies: CookieStore, hedge: HedgePolicy = None):
+        self.cookies = cookies
+        self.hedge = hedge
+        self.director = None
+        self.director_jar = None
+        self.users = {}   # director → 그 director를 쓰는 중인 YoutubeDL 수
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def open(self, opts: dict):
+        ydl = YoutubeDL(opts)
+        jar = self.cookies.get()
+        ydl.cookiejar = jar   # cached_property 자리에 공유 jar(쿠키 파일이 없어도 YoutubeDL마다 따로 만들지 않도록)
+        with self.lock:
+            if self.director is None or self.director_jar is not jar:
+                old = self.director
+                self.director, self.director_jar = ydl._request_director, jar
+                if self.hedge is not None:
+                    self.director = HedgedDirector(self.director, self.hedge)
+                if old is not None and not self.users.get(old):
+                    old.close()
+            director = self.director
+            self.users[director] = self.users.get(director, 0) + 1
+        ydl._request_director = director
+        with ydl:
+            try:
+                yield ydl
+            finally:
+                ydl.__dict__.pop("_request_director", None)   # close()가 공유 연결을 닫지 않도록
+                with self.lock:
+                    self.users[director] -= 1
+                    if not self.users[director]:
+                        del self.users[director]
+                        if director is not self.director:   # 쓰는 사이 교체됨 → 이제 닫아도 됨
+                            director.close()
+
+    def close(self):
+        with self.lock:
+            if self.director is not None and not self.users.get(self.director):
+                self.director.close()
+            self.director = None
+
 # ---------- 유틸 ----------
 def normalize_youtube_url(u: str) -> str:
     """항상 단일 영상만 받도록 playlist 관련 파라미터 제거"""
@@ -131,6 +405,37 @@ def normalize_youtube_url(u: str) -> str:
         keep.append(part)
     return base + ("?" + "&".join(keep) if keep else "")
 
+@contextlib.contextmanager
+def file_lock(path, stale_sec=30, wait_sec=10):
+    """
+    path + ".lock"을 O_EXCL로 만들어 여러 프로세스가 같은 파일을 읽고-합치고-쓰는 동안 서로 막음.
+    stale_sec보다 오래된 잠금은 죽은 프로세스가 남긴 것으로 보고 치움.
+    """
+    lock_path = path + ".lock"
+    deadline = time.monotonic() + wait_sec
+    while True:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            try:
+                if time.time() - os.path.getmtime(lock_path) > stale_sec:
+                    os.remove(lock_path)   # 죽은 프로세스가 남긴 잠금
+                    continue
+            except OSError:
+                continue
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"파일 잠금 대기 시간 초과: {lock_path}")
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        try:
+            os.remove(lock_path)
+        except OSError:
+            pass
+
 def sanitize_filename(name: str) -> str:
     name = re.sub(r"[\\/:*?\"<>|]+", " ", name)
     name = re.sub(r"\s+", " ", name).strip()
@@ -141,6 +446,7 @@ FORMAT_PRESETS = {
     "medium": ("bv*[height<=720]",   720),
     "low":    ("bv*[height<=480]",   480),
 }
+FORMAT_SORT = ["res", "br", "vcodec:avc1", "acodec:mp4a", "ext:mp4:m4a"]
 RES_LABEL = {"high": "(해상도 상) ", "medium": "(해상도 중) ", "low": "(해상도 하) "}
 
 def unique_path(outdir: str, base: str, ext: str) -> str:
@@ -176,18 +482,1895 @@ def find_neighbor_output(outdir: str, base: str):
         pass
     return None
 
+# ---------- 메타데이터 선읽기(클립보드 감시/입력 디바운스) ----------
+PREFETCH_TTL = 20 * 60   # 초; 스트림 URL이 만료되기 전에 버림
+PREFETCH_KEEP = 8        # 최근 URL 몇 개까지 보관(LRU)
+
+def format_size(n) -> str:
+    if not n:
+        return "?"
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f}{unit}" if unit in ("B", "KB") else f"{n:.1f}{unit}"
+        n /= 1024
+
+def format_duration(sec) -> str:
+    if not sec:
+        return "?"
+    sec = int(sec)
+    h, m, s = sec // 3600, sec % 3600 // 60, sec % 60
+    return f"{h}:{m:02d}:{s:02d}" if h else f"{m}:{s:02d}"
+
+SELECTION_KEYS = {"requested_downloads", "requested_formats", "requested_subtitles", "filepath", "_filename", "filename"}
+
+def reselectable(info: dict) -> dict:
+    """
+    이미 포맷 선택을 거친 info에서 선택 결과(requested_formats, 고른 포맷에서 복사된 format_id/코덱/해상도,
+    내부 키)를 걷어 낸 사본. 그대로 다시 process_ie_result에 넣으면 음성 하나만 골라도
+    이전 병합 결과가 남아 영상까지 받아 합침.
+    """
+    clean = copy.deepcopy(info)
+    drop = set(SELECTION_KEYS)
+    if clean.get("formats"):   # 포맷 목록이 있으면 맨 위의 포맷 필드는 모두 이전 선택에서 온 것
+        drop |= set().union(*(f.keys() for f in clean["formats"]))
+    for k in list(clean):
+        if k in drop or k.startswith("__"):
+            del clean[k]
+    return clean
+
+def _select(info: dict, fmt_str: str, merge_ext=None) -> dict:
+    opts = {"quiet": True, "no_warnings": True, "format": fmt_str,
+            "format_sort": FORMAT_SORT, "format_sort_force": True}
+    if merge_ext:
+        opts["merge_output_format"] = merge_ext
+    with YoutubeDL(opts) as ydl:
+        return ydl.process_ie_result(reselectable(info), download=False)
+
+def _picked(info: dict, res: dict) -> list:
+    if res.get("requested_formats"):
+        return list(res["requested_formats"])
+    fid = res.get("format_id")
+    return [f for f in info.get("formats") or [] if f.get("format_id") == fid] or [res]
+
+def selected_formats(info: dict, fmt_str: str) -> list:
+    """네트워크 없이 yt-dlp 규칙대로 fmt_str이 고를 포맷 목록을 구함"""
+    return _picked(info, _select(info, fmt_str))
+
+def stream_paths(info: dict, fmt_str: str, outpath: str, merge_ext=None) -> list:
+    """
+    [(포맷, yt-dlp가 그 트랙을 받을 경로)] — 병합이면 YoutubeDL.process_info와 같은 규칙
+    (병합 확장자로 correct_ext → 트랙 확장자로 correct_ext → "f<포맷ID>" prepend_extension),
+    단일 포맷이면 outtmpl 그대로. 137+251처럼 mkv로 병합되면 "T.mp4.f137.mp4"가 됨.
+    """
+    res = _select(info, fmt_str, merge_ext)
+    fmts = _picked(info, res)
+    if not res.get("requested_formats"):
+        return [(f, outpath) for f in fmts]
+    merged = res.get("ext")
+
+    def correct_ext(name, ext):
+        stem, real = os.path.splitext(name)
+        return f"{stem if real[1:] == merged else name}.{ext}"
+
+    temp = correct_ext(outpath, merged)
+    return [(f, prepend_extension(correct_ext(temp, f.get("ext")), f"f{f['format_id']}", f.get("ext")))
+            for f in fmts]
+
+def format_bytes(f: dict, duration=None) -> int:
+    """filesize → filesize_approx → tbr×길이 순으로 크기 추정(모르면 0)"""
+    n = f.get("filesize") or f.get("filesize_approx")
+    if not n and f.get("tbr") and duration:
+        n = f["tbr"] * 1000 / 8 * duration
+    return int(n or 0)
+
+def preset_sizes(info: dict) -> dict:
+    """해상도 프리셋/음성별 예상 크기(바이트)"""
+    sizes = {}
+    presets = [(k, f"{cap}[vcodec^=avc1]+ba[acodec^=mp4a]/{cap}+ba/best")
+               for k, (cap, _) in FORMAT_PRESETS.items()] + [("audio", "bestaudio/best")]
+    for key, fmt in presets:
+        try:
+            sizes[key] = sum(format_bytes(f, info.get("duration")) for f in selected_formats(info, fmt))
+        except Exception:
+            sizes[key] = 0
+    return sizes
+
+class MetadataPrefetcher:
+    """
+    URL이 보이면 다운로드 버튼을 누르기 전에 extract_info를 미리 돌려 둠.
+    - 새 URL이 들어오면 진행 중인 이전 선읽기는 취소(결과를 버림) — 작업자가 take()로 기다리는 것은 제외
+    - 다운로드가 시작되면 take()로 info를 넘겨받음(진행 중이면 끝날 때까지 기다림)
+    - 가져가지 않은 항목은 PREFETCH_TTL/PREFETCH_KEEP 기준으로 정리
+    """
+    def __init__(self, opts_factory, on_ready=None, session=None):
+        self.opts_factory = opts_factory   # () → 추출용 yt-dlp 옵션
+        self.on_ready = on_ready           # (url, info, sizes, err) — 선읽기 스레드에서 호출
+        self.session = session             # WorkerSession(없으면 매번 새 YoutubeDL)
+        self.entries = OrderedDict()       # url → 항목
+        self.lock = threading.Lock()
+
+    def request(self, url: str):
+        url = normalize_youtube_url(url)
+        with self.lock:
+            self._evict()
+            ent = self.entries.get(url)
+            if ent and ent["state"] in ("running", "ready"):
+                self.entries.move_to_end(url)
+                return
+            for other in [u for u, e in self.entries.items() if e["state"] == "running" and not e["claimed"]]:
+                self.entries.pop(other)["state"] = "cancelled"
+            ent = {"t": time.monotonic(), "state": "running", "info": None, "event": threading.Event(),
+                   "claimed": False}
+            self.entries[url] = ent
+        threading.Thread(target=self._run, args=(url, ent), daemon=True).start()
+
+    def _run(self, url, ent):
+        info, sizes, err = None, {}, None
+        try:
+            opener = self.session.open if self.session else YoutubeDL
+            with opener(self.opts_factory()) as ydl:
+                info = ydl.extract_info(url, download=False)
+            sizes = preset_sizes(info)
+        except Exception as e:
+            err = e
+        with self.lock:
+            cancelled = ent["state"] == "cancelled"
+            if not cancelled:
+                ent.update(t=time.monotonic(), info=info, state="ready" if info else "failed")
+            ent["event"].set()
+        if not cancelled and self.on_ready:
+            self.on_ready(url, info, sizes, err)
+
+    def take(self, url: str, timeout=120):
+        """다운로드 시작 시 호출: 따뜻한 (info, 추출 시각) 또는 (None, None)"""
+        url = normalize_youtube_url(url)
+        with self.lock:
+            ent = self.entries.get(url)
+            if ent:
+                ent["claimed"] = True   # 기다리는 동안 다른 URL 선읽기가 이것을 취소하지 않도록
+        if not ent:
+            return None, None
+        ent["event"].wait(timeout)
+        with self.lock:
+            if self.entries.get(url) is ent:
+                self.entries.pop(url)
+        if ent["state"] == "ready" and time.monotonic() - ent["t"] < PREFETCH_TTL:
+            return ent["info"], ent["t"]
+        return None, None
+
+    def keep(self, url: str, info: dict, at: float):
+        """공간 대기로 미뤄진 작업이 다시 시작할 때 재추출하지 않도록 info를 돌려놓음"""
+        url = normalize_youtube_url(url)
+        event = threading.Event()
+        event.set()
+        with self.lock:
+            self._evict()
+            self.entries[url] = {"t": at, "state": "ready", "info": info, "event": event, "claimed": False}
+
+    def _evict(self):
+        now = time.monotonic()
+        for u in [u for u, e in self.entries.items()
+                  if e["state"] != "running" and now - e["t"] >= PREFETCH_TTL]:
+            self.entries.pop(u)
+        for u in [u for u, e in self.entries.items() if not e["claimed"]][:max(0, len(self.entries) - PREFETCH_KEEP)]:
+            self.entries.pop(u)["state"] = "cancelled"
+
+# ---------- 디스크 공간(사전 크기 추정 + 입장 제어) ----------
+SPACE_MARGIN = 1.1                   # 추정치 여유 배율
+SPACE_RESERVE = 200 * 1024 * 1024    # 볼륨마다 항상 남겨 둘 공간
+
+def estimate_footprint(info: dict, mode: str, fmt_strs) -> dict:
+    """
+    선택될 포맷의 filesize/filesize_approx로 작업의 최대 사용량을 추정(바이트).
+    - parts: 내려받는 원본 스트림(keepvideo로 병합 후에도 남음)
+    - final: 병합/추출 결과물
+    - temp : 재인코딩 폴백 시 중간 파일(영상만)
+    크기를 알 수 없으면 빈 dict.
+    """
+    for fmt in fmt_strs:
+        try:
+            fmts = selected_formats(info, fmt)
+        except Exception:
+            continue   # 이 단계 포맷이 없으면 다음 폴백 기준으로 추정
+        parts = sum(format_bytes(f, info.get("duration")) for f in fmts)
+        if parts:
+            return {"parts": parts, "final": parts, "temp": parts if mode == "video" else 0}
+        break
+    return {}
+
+def volume_key(path):
+    try:
+        return os.stat(path).st_dev
+    except OSError:
+        return os.path.splitdrive(os.path.abspath(path))[0] or path
+
+class DiskWait(Exception):
+    """지금은 들어갈 자리가 없음 — 작업 스레드를 붙잡지 말고 작업을 대기열로 돌려보냄"""
+    def __init__(self, folder, need, free):
+        super().__init__(f"여유 공간 부족({folder}): 필요 {format_size(need)}, 여유 {format_size(free)}")
+        self.folder, self.need, self.free = folder, need, free
+        self.info = self.info_at = None   # 다시 시작할 때 재추출하지 않도록 넘겨 둘 메타데이터
+
+class DiskAdmission:
+    """
+    동시에 돌아가는 작업들의 예상 최대 사용량을 볼륨별로 예약해 두고,
+    들어갈 자리가 없는 작업은 DiskWait로 돌려보내 대기열에서 기다리게 함(작업 스레드는 다음 작업으로).
+    """
+    RECHECK_SEC = 60   # 대기열로 돌려보낸 작업을 다시 꺼내 보는 간격(다른 작업이 예약을 풀면 바로)
+
+    def __init__(self):
+        self.reserved = {}   # 볼륨 → 예약 바이트
+        self.lock = threading.Lock()
+
+    def _shortfall(self, needs: dict):
+        """needs: {볼륨: (폴더, 바이트)} → 부족하면 (폴더, 필요, 여유), 충분하면 None"""
+        for key, (d, n) in needs.items():
+            try:
+                free = shutil.disk_usage(d).free - self.reserved.get(key, 0) - SPACE_RESERVE
+            except OSError:
+                continue
+            if n > free:
+                return d, n, max(0, free)
+        return None
+
+    def admit(self, needs) -> dict:
+        """
+        needs: [(폴더, 바이트), ...] — 자리가 있으면 예약하고 예약 내역(티켓)을 반환.
+        지금 자리가 없으면 DiskWait, 볼륨을 다 비워도 모자라면 Exception(기다려도 소용없음).
+        """
+        by_vol = {}
+        for d, n in needs:
+            if n:
+                key = volume_key(d)
+                by_vol[key] = (d, by_vol.get(key, (d, 0))[1] + int(n * SPACE_MARGIN))
+        for d, n in by_vol.values():
+            try:
+                total = shutil.disk_usage(d).total
+            except OSError:
+                continue
+            if n > total - SPACE_RESERVE:
+                raise Exception(f"볼륨 전체 용량({format_size(total)})으로도 부족합니다({d}): 필요 {format_size(n)}")
+        with self.lock:
+            short = self._shortfall(by_vol)
+            if short:
+                raise DiskWait(*short)
+            for key, (_, n) in by_vol.items():
+                self.reserved[key] = self.reserved.get(key, 0) + n
+        return {key: n for key, (_, n) in by_vol.items()}
+
+    def release(self, ticket: dict):
+        with self.lock:
+            for key, n in ticket.items():
+                left = self.reserved.get(key, 0) - n
+                if left > 0:
+                    self.reserved[key] = left
+                else:
+                    self.reserved.pop(key, None)
+
+# ---------- 무결성(스트리밍 해시 + ffprobe 검증) ----------
+NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)   # Windows에서 콘솔 창 숨김
+
+def find_ffprobe(ffdir=None):
+    if ffdir:
+        for n in ("ffprobe.exe", "ffprobe"):
+            p = os.path.join(ffdir, n)
+            if os.path.isfile(p):
+                return p
+    return shutil.which("ffprobe.exe" if os.name == "nt" else "ffprobe")
+
+class StreamHasher:
+    """
+    다운로드 중인 .part 파일에서 새로 기록된 구간만 이어서 읽어 sha256을 누적.
+    (쓰기 직후라 페이지 캐시에 있는 부분만 한 번씩 읽음 → 완료 후 전체 재판독 없음)
+    Windows에서 yt-dlp의 rename을 막지 않도록 읽을 때마다 파일을 열고 닫음.
+    """
+    BLOCK = 1024 * 1024
+
+    def __init__(self):
+        self.path = None
+        self.offset = 0
+        self.h = hashlib.sha256()
+
+    def feed(self, path, upto):
+        if path != self.path or upto < self.offset:
+            self.path, self.offset, self.h = path, 0, hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                f.seek(self.offset)
+                while self.offset < upto:
+                    block = f.read(min(self.BLOCK, upto - self.offset))
+                    if not block:
+                        break   # 아직 버퍼에서 내려오지 않은 구간은 다음 호출에서
+                    self.h.update(block)
+                    self.offset += len(block)
+        except OSError:
+            pass
+
+    def finish(self, path, total):
+        """.part → 최종 이름으로 바뀐 파일 기준으로 남은 구간을 마저 읽고 (크기, sha256) 반환"""
+        if self.path and self.path != path and not self.path.startswith(path):
+            self.path, self.offset, self.h = path, 0, hashlib.sha256()
+        self.path = path
+        self.feed(path, total)
+        result = (self.offset, self.h.hexdigest())
+        self.path, self.offset, self.h = None, 0, hashlib.sha256()
+        return result
+
+class JobTrack:
+    """작업 하나가 진행 훅으로 보고받은 파일과 해시"""
+    def __init__(self):
+        self.hasher = StreamHasher()
+        self.files = []     # 작업 전체에서 'finished'로 보고된 파일(정리 대상)
+        self.current = []   # 이번 시도에서 보고된 파일(다운로드 순)
+        self.hashes = {}    # 경로 → (크기, sha256)
+        self.formats = {}   # 경로 → (영상 ID, 포맷 ID)
+        self.received = 0   # 네트워크로 실제 받은 바이트(캐시에서 가져온 것 제외, 작업자 처리량 통계용)
+
+    @property
+    def last_path(self):
+        return self.current[-1] if self.current else None
+
+    def begin(self):
+        self.current = []
+
+    def finished(self, path, total, key=None):
+        for lst in (self.files, self.current):
+            if path not in lst:
+                lst.append(path)
+        if key and all(key):
+            self.formats[path] = key
+        if path not in self.hashes and total:
+            self.hashes[path] = self.hasher.finish(path, total)
+            self.received += total
+
+    def adopt(self, path, got, key):
+        """스트림 캐시에서 가져다 놓은 파일(해시는 캐시 것을 그대로 사용)"""
+        if path not in self.files:
+            self.files.append(path)
+        self.hashes[path] = got
+        self.formats[path] = key
+
+    def move(self, src, dest):
+        """앞 단계에서 받은 스트림을 이번 단계 yt-dlp가 찾을 이름으로 옮김(추적 정보도 함께)"""
+        os.replace(src, dest)
+        self.files = [dest if p == src else p for p in self.files]
+        self.current = [dest if p == src else p for p in self.current]
+        for d in (self.hashes, self.formats):
+            if src in d:
+                d[dest] = d.pop(src)
+
+    def kept(self, paths):
+        """keepvideo 때문에 남은 후처리 입력 파일(원본 스트림은 이미 있음, 변환 전 병합본 등은 여기서 추가)"""
+        for p in paths:
+            if p not in self.files:
+                self.files.append(p)
+
+    def discard(self, path):
+        """검증에 실패한 파일 삭제(다음 시도에서 그 단계만 다시 수행)"""
+        self.hashes.pop(path, None)
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except OSError:
+            pass
+
+    def cleanup(self, keep=None, cache=None):
+        """keepvideo로 남은 파일 정리(온전한 원본 스트림은 캐시로, keep 외 전부 삭제, 이후 추적 중단)"""
+        for p in self.files:
+            key = self.formats.get(p)
+            if (cache is not None and key and p in self.hashes and os.path.exists(p)
+                    and self.intact(p) and verify_media(p, ())[0]):
+                cache.store(*key, p, self.hashes[p][1], keep_source=(p == keep))
+            if p != keep:
+                self.discard(p)
+        self.files = []
+
+    def intact(self, path) -> bool:
+        """스트리밍 해시 때 본 크기와 지금 크기가 같은지(잘림/덮어쓰기 감지)"""
+        got = self.hashes.get(path)
+        try:
+            return got is None or os.path.getsize(path) == got[0]
+        except OSError:
+            return False
+
+def probe_media(path, ffdir=None):
+    """ffprobe로 컨테이너 길이, 스트림 종류/코덱, 영상 높이를 조회(ffprobe가 없으면 None)"""
+    exe = find_ffprobe(ffdir)
+    if not exe:
+        return None
+    try:
+        r = subprocess.run(
+            [exe, "-v", "error", "-show_entries", "format=duration:stream=codec_type,codec_name,height",
+             "-of", "json", path],
+            capture_output=True, timeout=60, creationflags=NO_WINDOW)
+        data = json.loads(r.stdout.decode("utf-8", "replace") or "{}")
+    except Exception as e:
+        return {"duration": None, "streams": set(), "codecs": {}, "height": None, "error": str(e)}
+    try:
+        duration = float((data.get("format") or {}).get("duration"))
+    except (TypeError, ValueError):
+        duration = None
+    streams = data.get("streams") or []
+    return {
+        "duration": duration,
+        "streams": {s.get("codec_type") for s in streams},
+        "codecs": {s.get("codec_type"): s.get("codec_name") for s in reversed(streams)},   # 종류별 첫 스트림
+        "height": max((s.get("height") or 0 for s in streams), default=0) or None,
+        "error": r.stderr.decode("utf-8", "replace").strip() if r.returncode else "",
+    }
+
+def verify_media(path, want_streams, expect_duration=None, ffdir=None):
+    """(통과 여부, 사유) — 길이 오차는 max(2초, 2%)까지 허용"""
+    if not path or not os.path.exists(path) or os.path.getsize(path) <= 0:
+        return False, "파일 없음"
+    info = probe_media(path, ffdir)
+    if info is None:
+        return True, "ffprobe 없음(크기만 확인)"
+    if info["error"] or not info["streams"]:
+        return False, f"ffprobe 실패: {info['error'] or '스트림 없음'}"
+    missing = set(want_streams) - info["streams"]
+    if missing:
+        return False, f"스트림 없음: {', '.join(sorted(missing))}"
+    if expect_duration and info["duration"] is not None:
+        if abs(info["duration"] - expect_duration) > max(2.0, expect_duration * 0.02):
+            return False, f"길이 불일치 {info['duration']:.1f}s / 기대 {expect_duration:.1f}s"
+    return True, f"{info['duration'] or 0:.1f}s, {'+'.join(sorted(info['streams']))}"
+
+# ---------- 스트림 캐시(영상 ID + 포맷 ID, 용량 제한 LRU) ----------
+STREAM_CACHE_MB = 4096   # 기본 상한(config.json의 "stream_cache_mb"로 변경)
+
+class StreamCache:
+    """
+    받아 둔 원본 스트림(영상/음성 트랙)을 sha256 이름으로 보관하는 내용 주소 캐시.
+    index.json: "영상ID/포맷ID" → {"sha256", "size", "ext", "used"}
+    같은 (영상, 포맷)을 다시 고르면 yt-dlp가 받을 자리에 하드링크(안 되면 복사)해 두어
+    다운로드를 건너뛰고 후처리만 하게 함. 상한을 넘으면 오래 안 쓴 것부터 삭제.
+    같은 APPDATA를 쓰는 여러 --worker 프로세스가 함께 쓰므로, 바꿀 때마다 잠금 파일 아래에서
+    디스크의 index.json을 다시 읽어 그 위에 반영하고 씀(색인에서 빠진 blob도 정리 대상).
+    """
+    LOCK_STALE_SEC = 30
+
+    def __init__(self, root, limit_bytes):
+        self.root = root
+        self.limit = limit_bytes
+        self.lock = threading.Lock()
+        self.index = {}
+        self.synced = False   # 마지막 _load가 디스크 내용을 제대로 읽었는지(아니면 고아 blob 정리 안 함)
+        try:
+            os.makedirs(root, exist_ok=True)
+        except OSError:
+            pass
+        self._load()
+
+    def _blob(self, sha):
+        return os.path.join(self.root, sha)
+
+    def _index_path(self):
+        return os.path.join(self.root, "index.json")
+
+    def _load(self):
+        try:
+            with open(self._index_path(), "r", encoding="utf-8") as f:
+                self.index = {k: v for k, v in json.load(f).items()
+                              if os.path.isfile(self._blob(v["sha256"]))}
+            self.synced = True
+        except FileNotFoundError:
+            self.index, self.synced = {}, True
+        except Exception:
+            self.synced = False   # 읽다 만 파일 등 — 메모리의 것을 그대로 씀
+
+    @contextlib.contextmanager
+    def _locked(self):
+        """다른 프로세스가 쓴 색인을 다시 읽은 상태에서 변경(끝나면 호출한 쪽이 _save)"""
+        with self.lock, file_lock(self._index_path(), self.LOCK_STALE_SEC):
+            self._load()
+            yield
+
+    def _save(self):
+        try:
+            tmp = os.path.join(self.root, f"index.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.index, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self._index_path())
+        except Exception:
+            pass
+
+    def materialize(self, vid, fid, dest, expect_size=None):
+        """캐시에 있으면 dest에 놓고 (크기, sha256) 반환, 없으면 None"""
+        try:
+            with self._locked():
+                ent = self.index.get(f"{vid}/{fid}")
+                if not ent:
+                    return None
+                src = self._blob(ent["sha256"])
+                try:
+                    size = os.path.getsize(src)
+                except OSError:
+                    size = -1
+                if size != ent["size"] or (expect_size and expect_size != size):
+                    self.index.pop(f"{vid}/{fid}")   # 손상되었거나 서버 쪽 포맷이 바뀜
+                    self._save()
+                    return None
+                ent["used"] = time.time()
+                self._save()
+                got = ent["size"], ent["sha256"]
+                try:
+                    os.link(src, dest)
+                    return got
+                except OSError:
+                    pass
+        except Exception:
+            return None
+        try:
+            shutil.copyfile(src, dest)   # 하드링크가 안 되는 볼륨: 오래 걸릴 수 있어 잠금 밖에서 복사
+            if os.path.getsize(dest) == got[0]:
+                return got
+        except OSError:
+            pass
+        try:
+            os.remove(dest)   # 복사 도중 다른 프로세스가 정리함
+        except OSError:
+            pass
+        return None
+
+    def forget(self, vid, fid):
+        try:
+            with self._locked():
+                if self.index.pop(f"{vid}/{fid}", None):
+                    self._evict()
+                    self._save()
+        except Exception:
+            pass
+
+    def store(self, vid, fid, path, sha, keep_source=False):
+        """검증된 스트림을 캐시에 넣음(keep_source가 아니면 원본은 옮겨지고 사라짐)"""
+        try:
+            size = os.path.getsize(path)
+            if size > self.limit:
+                return
+            blob = self._blob(sha)
+            tmp = f"{blob}.{os.getpid()}.{threading.get_ident()}.tmp"
+            if not os.path.exists(blob):   # 옮기기/복사는 잠금 밖에서 임시 이름으로
+                if keep_source:
+                    try:
+                        os.link(path, tmp)
+                    except OSError:
+                        shutil.copyfile(path, tmp)
+                else:
+                    shutil.move(path, tmp)   # 같은 볼륨이면 rename, 아니면 복사 후 삭제
+            with self._locked():
+                if os.path.exists(tmp):
+                    if os.path.exists(blob):   # 그 사이 다른 프로세스가 같은 내용을 넣음
+                        os.remove(tmp)
+                    else:
+                        os.replace(tmp, blob)
+                if not keep_source and os.path.exists(path):
+                    os.remove(path)
+                self.index[f"{vid}/{fid}"] = {"sha256": sha, "size": size,
+                                              "ext": os.path.splitext(path)[1][1:], "used": time.time()}
+                self._evict()
+                self._save()
+        except Exception:
+            pass
+
+    def _evict(self):
+        blobs = {}
+        for ent in self.index.values():
+            blobs[ent["sha256"]] = ent["size"]
+        total = sum(blobs.values())
+        for key, ent in sorted(self.index.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.limit:
+                break
+            self.index.pop(key)
+            sha = ent["sha256"]
+            if not any(e["sha256"] == sha for e in self.index.values()):
+                total -= blobs.get(sha, 0)
+                try:
+                    os.remove(self._blob(sha))
+                except OSError:
+                    pass
+        if not self.synced:
+            return
+        # 색인에 없는 blob(예전 버전이 서로 덮어써 잃은 항목 등)은 상한 계산에서 빠지므로 지움
+        live = {e["sha256"] for e in self.index.values()}
+        try:
+            for fn in os.listdir(self.root):
+                if re.fullmatch(r"[0-9a-f]{64}", fn) and fn not in live:
+                    try:
+                        os.remove(self._blob(fn))
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+
+# ---------- 로컬 라이브러리(다운로드 기록 + 네트워크 없는 파생) ----------
+YOUTUBE_ID_REGEX = re.compile(r'(?:[?&]v=|youtu\.be/|/shorts/|/embed/|/live/)([0-9A-Za-z_-]{11})')
+VIDEO_EXTS = (".mp4", ".mkv", ".webm", ".mov")
+
+def youtube_id(url: str):
+    m = YOUTUBE_ID_REGEX.search(url or "")
+    return m.group(1) if m else None
+
+def strip_res_label(name: str) -> str:
+    for lbl in RES_LABEL.values():
+        if name.startswith(lbl):
+            return name[len(lbl):]
+    return name
+
+class DownloadArchive:
+    """
+    완료된 결과물 기록(archive.json): 영상 ID → [{"path", "mode", "height", "best_height", "has_audio", "title", "time"}]
+    여러 --worker 프로세스가 같은 파일을 쓰므로 추가할 때는 잠금 파일 아래에서 다시 읽고 합친 뒤 씀.
+    조회할 때도 파일 mtime이 바뀌었으면 다시 읽음(다른 프로세스가 만든 결과물도 로컬 원본으로).
+    """
+    LOCK_STALE_SEC = 30
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.data = {}
+        self.mtime = None
+        self._load()
+
+    def _load(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+            self.mtime = mtime
+        except Exception:
+            pass   # 없거나 읽다 만 파일 — 메모리의 것을 그대로 씀
+
+    def _refresh(self):
+        try:
+            if os.path.getmtime(self.path) != self.mtime:
+                self._load()
+        except OSError:
+            pass
+
+    def add(self, vid, rec: dict):
+        with self.lock:
+            try:
+                with file_lock(self.path, self.LOCK_STALE_SEC):
+                    self._load()   # 다른 프로세스가 그 사이 남긴 기록 포함
+                    self._put(vid, rec)
+                    tmp = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp, "w", encoding="utf-8") as f:
+                        json.dump(self.data, f, ensure_ascii=False, indent=1)
+                    os.replace(tmp, self.path)
+                    self.mtime = os.path.getmtime(self.path)
+            except Exception:
+                self._put(vid, rec)   # 못 썼어도 이 프로세스에서는 원본으로 쓸 수 있게
+
+    def _put(self, vid, rec):
+        recs = [r for r in self.data.get(vid, [])   # 지워진 결과물 기록은 함께 정리
+                if r.get("path") != rec["path"] and os.path.isfile(r.get("path", ""))]
+        self.data[vid] = recs + [rec]
+
+    def sources(self, vid) -> list:
+        """아직 디스크에 남아 있는 결과물 기록만"""
+        with self.lock:
+            self._refresh()
+            return [dict(r) for r in self.data.get(vid, []) if os.path.isfile(r.get("path", ""))]
+
+    def by_path(self, path):
+        """결과물 경로로 (영상 ID, 기록) 찾기 — 없으면 (None, None)"""
+        path = os.path.normcase(os.path.abspath(path))
+        with self.lock:
+            self._refresh()
+            for vid, recs in self.data.items():
+                for r in recs:
+                    if os.path.normcase(r.get("path", "")) == path:
+                        return vid, dict(r)
+        return None, None
+
+def find_ffmpeg_exe(ffdir=None):
+    if ffdir:
+        for n in ("ffmpeg.exe", "ffmpeg"):
+            p = os.path.join(ffdir, n)
+            if os.path.isfile(p):
+                return p
+    return shutil.which("ffmpeg.exe" if os.name == "nt" else "ffmpeg")
+
+def derive_media(src, dest, mode, height=None, ffdir=None, copy_ok=True):
+    """
+    네트워크 없이 로컬 파일에서 음성(m4a) 추출 또는 height 이하로 축소한 mp4를 만듦.
+    프로세스 풀에서도 돌도록 모듈 수준 함수로 둠.
+    반환: (True/False/None(건너뜀), 메시지)
+    """
+    info = probe_media(src, ffdir)
+    exe = find_ffmpeg_exe(ffdir)
+    if not info or info["error"] or not exe:
+        return False, f"원본 확인 실패({(info or {}).get('error') or 'ffmpeg/ffprobe 없음'})"
+    acodec = info["codecs"].get("audio")
+    if mode == "audio":
+        if "audio" not in info["streams"]:
+            return None, "음성 트랙 없음"
+        args = ["-vn", "-map", "0:a:0", "-c:a", "copy" if acodec == "aac" else "aac"]
+        want = {"audio"}
+    else:
+        if "video" not in info["streams"]:
+            return None, "영상 트랙 없음"
+        args = ["-map", "0:v:0", "-map", "0:a:0?"]
+        if height and info["height"] and info["height"] > height:
+            args += ["-vf", f"scale=-2:{height}", "-c:v", "libx264", "-pix_fmt", "yuv420p"]
+        elif copy_ok:
+            args += ["-c:v", "copy"]
+        else:
+            return None, f"이미 {info['height']}p"
+        args += ["-c:a", "copy" if acodec == "aac" else "aac"]
+        want = {"video"} | ({"audio"} & info["streams"])
+    stem, ext = os.path.splitext(dest)
+    tmp = f"{stem}.derive{ext}"
+    try:
+        r = subprocess.run([exe, "-y", "-v", "error", "-i", src] + args + ["-movflags", "+faststart", tmp],
+                           capture_output=True, creationflags=NO_WINDOW)
+        if r.returncode:
+            raise RuntimeError(r.stderr.decode("utf-8", "replace").strip()[-300:] or f"ffmpeg 종료 코드 {r.returncode}")
+        ok, why = verify_media(tmp, want, info["duration"], ffdir)
+        if not ok:
+            raise RuntimeError(why)
+        os.replace(tmp, dest)
+        return True, why
+    except Exception as e:
+        try:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        except OSError:
+            pass
+        return False, str(e)
+
+def derive_folder(folder, mode, res_preset, ffdir=None, on_result=None, workers=None) -> int:
+    """폴더 안의 영상 전부를 프로세스 풀로 한꺼번에 파생(음성 추출 또는 해상도 축소)"""
+    cap = FORMAT_PRESETS.get(res_preset, FORMAT_PRESETS["high"])[1]
+    label = RES_LABEL.get(res_preset, "")
+    jobs = []
+    for fn in sorted(os.listdir(folder)):
+        src = os.path.join(folder, fn)
+        name, ext = os.path.splitext(fn)
+        if (not os.path.isfile(src) or ext.lower() not in VIDEO_EXTS
+                or name.endswith(".derive") or re.search(r"\.f\d+(-\w+)?$", name)):
+            continue   # 작업 중 파일/원본 트랙(yt-dlp의 "<이름>.f<포맷ID>") 제외
+        base = strip_res_label(name)
+        if mode == "audio":
+            out_base, out_ext = base, "m4a"
+        elif name.startswith(label):
+            continue
+        else:
+            out_base, out_ext = f"{label}{base}", "mp4"
+        if os.path.exists(os.path.join(folder, f"{sanitize_filename(out_base)}.{out_ext}")):
+            continue   # 이미 만들어 둔 결과물
+        jobs.append((src, unique_path(folder, out_base, out_ext)))
+    if not jobs:
+        return 0
+    workers = workers or max(1, (os.cpu_count() or 2) // 2)   # ffmpeg 자체도 멀티스레드
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futs = {pool.submit(derive_media, src, dest, mode, cap, ffdir, False): (src, dest)
+                for src, dest in jobs}
+        for fut in concurrent.futures.as_completed(futs):
+            src, dest = futs[fut]
+            try:
+                ok, msg = fut.result()
+            except Exception as e:
+                ok, msg = False, str(e)
+            if on_result:
+                on_result(src, dest, ok, msg)
+    return len(jobs)
+
+# ---------- 대역폭 스케줄러(전역 토큰 버킷 + 작업별 우선순위) ----------
+PRIORITY_WEIGHT = {"high": 4, "normal": 2, "low": 1}
+PRIORITY_LABEL = {"high": "높음", "normal": "보통", "low": "낮음"}
+MIN_LANE_RATE = 64 * 1024   # 어떤 작업도 이 속도 아래로는 배분하지 않음(굶주림 방지)
+
+def _kbps(v):
+    """config.json의 KB/s 값 → 바이트/초(0/없음 = 무제한 → None)"""
+    try:
+        return int(float(v) * 1024) if v and float(v) > 0 else None
+    except (TypeError, ValueError):
+        return None
+
+def _minutes(hhmm: str) -> int:
+    h, _, m = str(hhmm).partition(":")
+    return (int(h) * 60 + int(m or 0)) % (24 * 60)
+
+class TokenBucket:
+    """초당 rate 바이트씩 채워지는 토큰 버킷(rate가 None이면 무제한)"""
+    def __init__(self, rate=None, burst_sec=1.0):
+        self.rate = rate
+        self.burst_sec = burst_sec
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate:
+            self.tokens = min(self.rate * self.burst_sec,
+                              self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def set_rate(self, rate):
+        with self.lock:
+            self._refill()
+            self.rate = rate
+
+    def take(self, n: int) -> float:
+        """n바이트를 소비하고, 한도를 넘었으면 기다려야 할 시간(초)을 반환"""
+        with self.lock:
+            self._refill()
+            if not self.rate:
+                return 0.0
+            self.tokens -= n
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+class BandwidthLane:
+    """스케줄러에 등록된 작업 하나의 몫(우선순위, 작업 한도, 관측 속도)"""
+    def __init__(self, priority="normal", limit=None):
+        self.priority = priority if priority in PRIORITY_WEIGHT else "normal"
+        self.limit = limit
+        self.bucket = TokenBucket()
+        self.speed = None   # ydl_progress_hook이 받은 speed(바이트/초)
+        self.seen = 0       # 마지막으로 본 downloaded_bytes
+
+    def demand(self):
+        """이 작업이 실제로 쓸 수 있는 대역폭 추정(None = 제한 없음)"""
+        cands = []
+        if self.limit:
+            cands.append(self.limit)
+        if self.speed:
+            # 관측 속도보다 조금 더 주어 서버가 허락하면 점점 올라가게 함
+            cands.append(max(MIN_LANE_RATE, self.speed * 1.25))
+        return min(cands) if cands else None
+
+class BandwidthScheduler:
+    """
+    모든 작업이 공유하는 전역 토큰 버킷.
+    - 전역 상한: bandwidth.limit_kbps (시간대별 schedule 항목이 있으면 그 값이 우선)
+    - 작업 한도: bandwidth.job_limit_kbps[우선순위]
+    - 우선순위 가중치(PRIORITY_WEIGHT)로 전역 상한을 나누고,
+      몫을 다 쓰지 못하는 작업의 남는 몫은 나머지 작업에 재분배
+    """
+    REBALANCE_SEC = 1.0
+
+    def __init__(self, limit=None, job_limits=None, schedule=None):
+        self.limit = limit
+        self.job_limits = job_limits or {}
+        self.schedule = schedule or []   # [(시작 분, 끝 분, 상한)]
+        self.bucket = TokenBucket()
+        self.lanes = []
+        self.lock = threading.Lock()
+        self.balanced_at = 0.0
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        bw = cfg.get("bandwidth") or {}
+        schedule = []
+        for ent in bw.get("schedule") or []:
+            try:
+                schedule.append((_minutes(ent["start"]), _minutes(ent["end"]),
+                                 _kbps(ent.get("limit_kbps"))))
+            except Exception:
+                pass
+        job_limits = {k: _kbps(v) for k, v in (bw.get("job_limit_kbps") or {}).items()}
+        return cls(_kbps(bw.get("limit_kbps")), job_limits, schedule)
+
+    def current_limit(self, now=None):
+        t = time.localtime(now)
+        m = t.tm_hour * 60 + t.tm_min
+        for start, end, limit in self.schedule:
+            inside = start <= m < end if start <= end else (m >= start or m < end)
+            if inside:
+                return limit
+        return self.limit
+
+    def open(self, priority="normal", limit=None) -> BandwidthLane:
+        lane = BandwidthLane(priority, limit or self.job_limits.get(priority))
+        with self.lock:
+            self.lanes.append(lane)
+            self._rebalance()
+        return lane
+
+    def close(self, lane: BandwidthLane):
+        with self.lock:
+            if lane in self.lanes:
+                self.lanes.remove(lane)
+            self._rebalance()
+
+    def _rebalance(self):
+        cap = self.current_limit()
+        self.bucket.set_rate(cap)
+        self.balanced_at = time.monotonic()
+        if not cap:
+            for ln in self.lanes:
+                ln.bucket.set_rate(ln.limit)
+            return
+        left, pending = float(cap), list(self.lanes)
+        while pending:
+            wsum = sum(PRIORITY_WEIGHT[ln.priority] for ln in pending)
+            capped = [ln for ln in pending
+                      if ln.demand() is not None
+                      and ln.demand() < left * PRIORITY_WEIGHT[ln.priority] / wsum]
+            if not capped:
+                for ln in pending:
+                    ln.bucket.set_rate(max(MIN_LANE_RATE, left * PRIORITY_WEIGHT[ln.priority] / wsum))
+                break
+            for ln in capped:
+                d = ln.demand()
+                ln.bucket.set_rate(d)
+                left = max(0.0, left - d)
+                pending.remove(ln)
+
+    def throttle(self, lane: BandwidthLane, downloaded: int, speed=None):
+        """진행 훅에서 호출: 새로 받은 바이트만큼 토큰을 소비하고 필요하면 대기"""
+        n = downloaded - lane.seen if downloaded >= lane.seen else downloaded  # 다음 스트림이면 0부터
+        lane.seen = downloaded
+        if speed:
+            lane.speed = speed
+        if time.monotonic() - self.balanced_at >= self.REBALANCE_SEC:
+            with self.lock:
+                self._rebalance()
+        wait = max(self.bucket.take(n), lane.bucket.take(n))
+        if wait > 0:
+            time.sleep(min(wait, 5.0))
+
+# ---------- 프로파일링(--profile 또는 환경 변수 YTDL_PROFILE) ----------
+PROFILER = None              # enable_profiling()으로 켬. 꺼져 있으면 profile_* 함수는 아무것도 안 함
+PROFILE_SAMPLE_SEC = 0.005   # 스택 샘플 간격
+PROFILE_STACK_DEPTH = 40
+PROFILE_HOTSPOTS = {         # 보고서끼리 비교하기 쉽도록 뽑아 두는 함수(누적 시간)
+    "extract_info": "extract_info",
+    "progress_hook": "ydl_progress_hook",
+    "throttle": "throttle",
+    "verify_media": "verify_media",
+    "subprocess": "communicate",
+}
+
+def _fold(frame) -> str:
+    """프레임 → 'file:func;file:func;...'(바깥→안쪽) 한 줄"""
+    names = []
+    while frame is not None and len(names) < PROFILE_STACK_DEPTH:
+        names.append(f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+def _child_cpu(proc):
+    """끝난 자식 프로세스의 CPU 시간(초). Windows는 프로세스 핸들로 정확히, 그 외는 None"""
+    if not sys.platform.startswith("win"):
+        return None
+    try:
+        import ctypes
+        from ctypes import wintypes
+        ft = [wintypes.FILETIME() for _ in range(4)]   # 생성/종료/커널/사용자
+        if ctypes.windll.kernel32.GetProcessTimes(int(proc._handle), *(ctypes.byref(f) for f in ft)):
+            return sum((f.dwHighDateTime << 32 | f.dwLowDateTime) for f in ft[2:]) / 1e7
+    except Exception:
+        pass
+    return None
+
+class JobProfile:
+    """작업 하나의 측정값(작업 스레드 기준)"""
+    def __init__(self, label):
+        self.label = label
+        self.started = time.time()
+        self.t0 = time.perf_counter()
+        self.phases = []
+        self.snapshot = None
+        self.phase_peak = 0           # 이번 단계 동안 샘플러가 본 추적 메모리 최대치
+        self.samples = Counter()      # 작업 스레드 스택
+        self.ui_samples = Counter()   # 같은 시간 동안 메인(Tk) 스레드 스택
+        self.ui = {}                  # 메시지 종류 → [횟수, 합계, 최대]
+        self.children = []
+        self.cprof = cProfile.Profile()
+        self.cprof_note = None
+
+class Profiler:
+    """
+    작업별 보고서(JSON + cProfile .prof)를 outdir에 남김.
+    - cProfile: 작업 스레드, 스택 샘플: 작업 스레드 + 메인(Tk) 스레드
+    - 단계 경계마다 tracemalloc(현재/단계 중 최대/증감, 늘어난 할당 위치) — 프로세스 전체 기준
+    - ffmpeg 등 자식 프로세스의 실행 시간/CPU 시간
+    """
+    def __init__(self, outdir):
+        self.outdir = outdir
+        os.makedirs(outdir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.jobs = {}   # 스레드 ID → JobProfile
+        self.main = threading.main_thread().ident
+        tracemalloc.start(10)
+        self._patch_subprocess()
+        threading.Thread(target=self._sample_loop, daemon=True).start()
+
+    def _patch_subprocess(self):
+        """subprocess.Popen(yt-dlp의 Popen 포함)이 끝날 때 실행 시간/CPU를 현재 작업에 기록"""
+        init, wait = subprocess.Popen.__init__, subprocess.Popen.wait
+
+        def patched_init(proc, *a, **kw):
+            proc._prof_t0, proc._prof_c0 = time.perf_counter(), os.times()
+            init(proc, *a, **kw)
+
+        def patched_wait(proc, *a, **kw):
+            running = proc.returncode is None
+            try:
+                return wait(proc, *a, **kw)
+            finally:
+                if running and proc.returncode is not None:
+                    self.child_done(proc)
+
+        subprocess.Popen.__init__, subprocess.Popen.wait = patched_init, patched_wait
+
+    def child_done(self, proc):
+        jp = self.jobs.get(threading.get_ident())
+        if jp is None or not hasattr(proc, "_prof_t0"):
+            return
+        cpu = _child_cpu(proc)
+        if cpu is None:   # POSIX: 대기 전후 자식 CPU 합계 차이(동시에 끝난 다른 자식이 섞일 수 있음)
+            c0, c1 = proc._prof_c0, os.times()
+            cpu = (c1.children_user + c1.children_system) - (c0.children_user + c0.children_system)
+        args = proc.args if isinstance(proc.args, (list, tuple)) else str(proc.args).split()
+        jp.children.append({"exe": os.path.basename(str(args[0])) if args else "?",
+                            "phase": jp.phases[-1]["name"] if jp.phases else None,
+                            "wall": round(time.perf_counter() - proc._prof_t0, 3), "cpu": round(cpu, 3)})
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(PROFILE_SAMPLE_SEC)
+            with self.lock:
+                jobs = list(self.jobs.items())
+            if not jobs:
+                continue
+            frames = sys._current_frames()
+            ui = _fold(frames[self.main]) if self.main in frames else None
+            mem = tracemalloc.get_traced_memory()[0]
+            for ident, jp in jobs:
+                jp.phase_peak = max(jp.phase_peak, mem)
+                if ident in frames:
+                    jp.samples[_fold(frames[ident])] += 1
+                if ui:
+                    jp.ui_samples[ui] += 1
+            del frames
+
+    @contextlib.contextmanager
+    def job(self, label):
+        jp = JobProfile(label)
+        ident = threading.get_ident()
+        with self.lock:
+            self.jobs[ident] = jp
+        try:
+            jp.cprof.enable()
+        except ValueError as e:   # Python 3.12+: 다른 작업 스레드의 cProfile이 이미 켜져 있음
+            jp.cprof, jp.cprof_note = None, str(e)
+        self.phase("start")
+        try:
+            yield jp
+        finally:
+            if jp.cprof:
+                jp.cprof.disable()
+            self.phase(None)
+            with self.lock:
+                self.jobs.pop(ident, None)
+            try:
+                self.write(jp)
+            except Exception:
+                pass
+
+    def phase(self, name):
+        """
+        단계 경계: 앞 단계를 닫고(걸린 시간, 메모리, 늘어난 할당 위치) name 단계를 시작. None이면 닫기만.
+        tracemalloc은 프로세스 전체 기준이라 동시 작업이 있으면 섞임 — 전역 최대치(reset_peak)는 건드리지 않고
+        단계 동안 샘플러가 본 최대치(mem_peak)와 단계 시작 대비 증감(mem_delta)만 기록.
+        """
+        jp = self.jobs.get(threading.get_ident())
+        if jp is None:
+            return
+        now = time.perf_counter() - jp.t0
+        snap = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        cur = tracemalloc.get_traced_memory()[0]
+        if jp.phases:
+            ent = jp.phases[-1]
+            ent.update(
+                dur=round(now - ent["at"], 3), mem_current=cur, mem_delta=cur - ent.pop("mem_start"),
+                mem_peak=max(jp.phase_peak, cur),
+                top_alloc=[{"where": str(s.traceback[0]), "size_diff": s.size_diff, "count_diff": s.count_diff}
+                           for s in snap.compare_to(jp.snapshot, "lineno")[:5]])
+        jp.snapshot = snap
+        jp.phase_peak = cur
+        if name:
+            jp.phases.append({"name": name, "at": round(now, 3), "mem_start": cur})
+
+    def ui_call(self, kind, secs):
+        with self.lock:
+            for jp in self.jobs.values():
+                st = jp.ui.setdefault(kind, [0, 0.0, 0.0])
+                st[0] += 1; st[1] += secs; st[2] = max(st[2], secs)
+
+    def write(self, jp):
+        label = re.sub(r"[^\w.-]+", "_", jp.label)[:40] or "job"
+        stem = os.path.join(self.outdir, time.strftime("%Y%m%d-%H%M%S", time.localtime(jp.started))
+                            + f"-{threading.get_ident() % 10000:04d}-{label}")
+        cpu_top, hot = [], {}
+        if jp.cprof:
+            jp.cprof.dump_stats(stem + ".prof")
+            for (fn, line, name), (_cc, nc, tt, ct, _callers) in pstats.Stats(jp.cprof).stats.items():
+                cpu_top.append({"func": f"{os.path.basename(fn)}:{line}({name})", "calls": nc,
+                                "tottime": round(tt, 4), "cumtime": round(ct, 4)})
+                for key, func in PROFILE_HOTSPOTS.items():
+                    if name == func:
+                        hot[key] = round(max(hot.get(key, 0.0), ct), 4)
+            cpu_top.sort(key=lambda r: -r["cumtime"])
+        report = {
+            "job": jp.label,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(jp.started)),
+            "wall": round(sum(p.get("dur", 0.0) for p in jp.phases), 3),
+            "phases": jp.phases,
+            "mem_scope": "process",   # 메모리 수치는 프로세스 전체(동시 작업 포함) 기준
+            "hotspots": hot,
+            "cprofile_top": cpu_top[:30],
+            "cprofile_note": jp.cprof_note,
+            "samples_interval": PROFILE_SAMPLE_SEC,
+            "worker_stacks": [{"stack": k, "count": v} for k, v in jp.samples.most_common(20)],
+            "ui_stacks": [{"stack": k, "count": v} for k, v in jp.ui_samples.most_common(20)],
+            "ui_messages": {k: {"count": c, "total": round(t, 4), "max": round(m, 4)} for k, (c, t, m) in jp.ui.items()},
+            "subprocess": jp.children,
+            "subprocess_cpu": round(sum(c["cpu"] for c in jp.children), 3),
+        }
+        with open(stem + ".json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+def enable_profiling(outdir=None):
+    global PROFILER
+    if PROFILER is None:
+        PROFILER = Profiler(outdir or os.path.join(os.path.dirname(get_config_path()), "profiles"))
+    return PROFILER
+
+def profile_job(label):
+    return PROFILER.job(label) if PROFILER else contextlib.nullcontext()
+
+def profile_phase(name):
+    if PROFILER:
+        PROFILER.phase(name)
+
+def profile_ui(kind, secs):
+    if PROFILER:
+        PROFILER.ui_call(kind, secs)
+
+def profile_compare(a, b):
+    """보고서 두 개(JSON)의 단계/주요 함수/자식 CPU/메모리(프로세스 전체 기준 최대치, 단계별 증감)를 나란히 출력"""
+    reports = []
+    for path in (a, b):
+        with open(path, encoding="utf-8") as f:
+            reports.append(json.load(f))
+    ra, rb = reports
+
+    def flat(r):
+        out = {"wall": r["wall"], "subprocess_cpu": r["subprocess_cpu"],
+               "mem_peak_mb": max((p.get("mem_peak", 0) for p in r["phases"]), default=0) / 1024 / 1024}
+        for p in r["phases"]:   # 재시도로 같은 단계가 여러 번이면 합산
+            out[f"phase:{p['name']}"] = out.get(f"phase:{p['name']}", 0.0) + p.get("dur", 0.0)
+            out[f"mem_delta_mb:{p['name']}"] = out.get(f"mem_delta_mb:{p['name']}", 0.0) + p.get("mem_delta", 0) / 1024 / 1024
+        for k, v in r["hotspots"].items():
+            out[f"func:{k}"] = v
+        for k, v in r["ui_messages"].items():
+            out[f"ui:{k}"] = v["total"]
+        return out
+
+    fa, fb = flat(ra), flat(rb)
+    print(f"{'':28} {os.path.basename(a)[:22]:>22} {os.path.basename(b)[:22]:>22} {'차이':>9}")
+    for k in list(fa) + [k for k in fb if k not in fa]:
+        va, vb = fa.get(k), fb.get(k)
+        diff = f"{(vb - va) / va * 100:+.0f}%" if va and vb is not None else ""
+        print(f"{k:28} {'-' if va is None else f'{va:.3f}':>22} {'-' if vb is None else f'{vb:.3f}':>22} {diff:>9}")
+
+# ---------- 작업 저장소(로컬 대기열 / 여러 PC가 공유하는 SQLite) ----------
+LEASE_SEC = 60          # 임대 기간 — 하트비트가 끊기면 이 시간 뒤 다른 작업자가 회수
+HEARTBEAT_SEC = LEASE_SEC / 3
+LEASE_RETRY_MAX = 30    # 저장소 접근 실패 시 임대 재시도 간격 상한(1, 2, 4, … 초)
+NODE_ALIVE_SEC = 2 * LEASE_SEC
+MAX_LEASES = 3          # 작업자가 계속 죽는 작업은 이 횟수 뒤 실패 처리
+YIELD_MAX_WAIT = 30     # 더 나은 작업자에게 양보하더라도 작업이 이만큼 기다렸으면 누구든 가져감
+PRIORITY_RANK = {"high": 0, "normal": 1, "low": 2}
+
+def default_node_name() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def node_scores(rows) -> list:
+    """(처리량, 최근 403 비율) → 0~1 점수. 처리량을 모르는 새 작업자는 처리량 만점으로 봄"""
+    best = max((r[0] for r in rows if r and r[0]), default=None)
+    return [(1.0 - min(1.0, r[1] or 0.0)) * (r[0] / best if best and r[0] else 1.0) if r else 1.0
+            for r in rows]
+
+def should_yield(me, others, queued, waited) -> bool:
+    """빈자리가 있으면서 나보다 20% 이상 나은 작업자가 대기 작업 수 이상이면 그쪽에 양보"""
+    if waited >= YIELD_MAX_WAIT or not others:
+        return False
+    mine, *theirs = node_scores([me] + list(others))
+    return sum(1 for s in theirs if s > mine * 1.2) >= queued
+
+class LocalJobStore:
+    """
+    한 프로세스 안의 대기열(기본값). SQLiteJobStore와 같은 인터페이스.
+    같은 프로세스의 작업 스레드는 작업을 쥔 채 사라지지 않으므로 임대 만료/회수가 없음
+    (오래 걸리는 다운로드나 공간 대기를 다른 스레드가 가져가 두 번 받는 일이 없도록).
+    """
+    shared = False
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.jobs = {}
+        self.next_id = 1
+
+    def register(self, node, slots):
+        pass
+
+    def put(self, job: dict, priority="normal") -> int:
+        with self.cond:
+            job_id, self.next_id = self.next_id, self.next_id + 1
+            self.jobs[job_id] = {"job": job, "rank": PRIORITY_RANK.get(priority, 1), "state": "queued",
+                                 "node": None, "not_before": 0.0}
+            self.cond.notify()
+            return job_id
+
+    def lease(self, node, timeout=1.0):
+        deadline = time.monotonic() + timeout
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                ready = sorted((j["rank"], i) for i, j in self.jobs.items()
+                               if j["state"] == "queued" and j["not_before"] <= now)
+                if ready:
+                    job_id = ready[0][1]
+                    ent = self.jobs[job_id]
+                    ent.update(state="leased", node=node)
+                    return job_id, dict(ent["job"])
+                if now >= deadline:
+                    return None
+                self.cond.wait(deadline - now)
+
+    def renew(self, node, job_ids):
+        pass
+
+    def defer(self, job_id, node, job: dict, delay):
+        """공간 대기: 작업을 대기열로 돌려보내 delay초 뒤(또는 wake() 때) 다시 꺼내게 함"""
+        with self.cond:
+            ent = self.jobs.get(job_id)
+            if ent is not None:
+                ent.update(job=job, state="queued", node=None, not_before=time.monotonic() + delay)
+
+    def wake(self):
+        """디스크 예약이 풀렸을 때: 미뤄 둔 작업을 바로 다시 꺼낼 수 있게"""
+        with self.cond:
+            for ent in self.jobs.values():
+                ent["not_before"] = 0.0
+            self.cond.notify_all()
+
+    def complete(self, job_id, node, result: dict):
+        with self.cond:
+            self.jobs.pop(job_id, None)   # 로컬 대기열은 결과를 오래 들고 있을 필요 없음
+
+    def result(self, job_id):
+        return None
+
+class SQLiteJobStore:
+    """
+    공유 볼륨의 SQLite 파일 하나를 여러 PC/프로세스의 엔진이 같이 쓰는 작업 저장소.
+    - 임대(lease) + 하트비트: 죽은 작업자의 작업은 임대가 끝나면 다른 작업자가 회수
+    - 분배: 작업자별 처리량(EWMA)과 최근 403 비율로 점수를 매겨 나은 작업자가 먼저 가져감
+    """
+    shared = True
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS jobs(
+        id INTEGER PRIMARY KEY AUTOINCREMENT, job TEXT NOT NULL, rank INTEGER NOT NULL DEFAULT 1,
+        state TEXT NOT NULL DEFAULT 'queued', node TEXT, lease_until REAL, leases INTEGER NOT NULL DEFAULT 0,
+        result TEXT, created REAL NOT NULL, updated REAL NOT NULL, not_before REAL NOT NULL DEFAULT 0);
+    CREATE INDEX IF NOT EXISTS jobs_state ON jobs(state, rank, id);
+    CREATE TABLE IF NOT EXISTS nodes(
+        node TEXT PRIMARY KEY, seen REAL NOT NULL, slots INTEGER NOT NULL DEFAULT 1,
+        busy INTEGER NOT NULL DEFAULT 0, throughput REAL, rate403 REAL NOT NULL DEFAULT 0,
+        done INTEGER NOT NULL DEFAULT 0);
+    """
+    EWMA = 0.3
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        db = self._db()
+        db.executescript(self.SCHEMA)
+        if "not_before" not in {r[1] for r in db.execute("PRAGMA table_info(jobs)")}:   # 이전 버전 저장소
+            db.execute("ALTER TABLE jobs ADD COLUMN not_before REAL NOT NULL DEFAULT 0")
+
+    def _db(self):
+        db = getattr(self.local, "db", None)
+        if db is None:
+            # 네트워크 공유 폴더에서는 WAL이 안전하지 않아 기본 저널 모드 사용
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self.local.db = db
+        return db
+
+    @contextlib.contextmanager
+    def _tx(self):
+        db = self._db()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def register(self, node, slots):
+        with self._tx() as db:
+            db.execute("INSERT INTO nodes(node, seen, slots) VALUES(?, ?, ?) "
+                       "ON CONFLICT(node) DO UPDATE SET seen=excluded.seen, slots=excluded.slots, busy=0",
+                       (node, time.time(), slots))
+
+    def put(self, job: dict, priority="normal") -> int:
+        now = time.time()
+        with self._tx() as db:
+            cur = db.execute("INSERT INTO jobs(job, rank, created, updated) VALUES(?, ?, ?, ?)",
+                             (json.dumps(job, ensure_ascii=False), PRIORITY_RANK.get(priority, 1), now, now))
+            return cur.lastrowid
+
+    def lease(self, node, timeout=1.0):
+        now = time.time()
+        with self._tx() as db:
+            db.execute("UPDATE jobs SET state='failed', result=?, updated=? "
+                       "WHERE state='leased' AND lease_until<? AND leases>=?",
+                       (json.dumps({"ok": False, "msg": "작업자가 반복해서 중단되어 포기"}, ensure_ascii=False),
+                        now, now, MAX_LEASES))
+            rows = db.execute("SELECT id, job, created FROM jobs WHERE (state='queued' AND not_before<=?) "
+                              "OR (state='leased' AND lease_until<?) ORDER BY rank, id", (now, now)).fetchall()
+            if rows:
+                me = db.execute("SELECT throughput, rate403 FROM nodes WHERE node=?", (node,)).fetchone()
+                others = db.execute("SELECT throughput, rate403 FROM nodes WHERE node<>? AND seen>? AND busy<slots",
+                                    (node, now - NODE_ALIVE_SEC)).fetchall()
+                job_id, job, created = rows[0]
+                if not should_yield(me, others, len(rows), now - created):
+                    db.execute("UPDATE jobs SET state='leased', node=?, lease_until=?, leases=leases+1, updated=? "
+                               "WHERE id=?", (node, now + LEASE_SEC, now, job_id))
+                    db.execute("UPDATE nodes SET busy=busy+1, seen=? WHERE node=?", (now, node))
+                    return job_id, json.loads(job)
+        time.sleep(timeout)
+        return None
+
+    def renew(self, node, job_ids):
+        now = time.time()
+        with self._tx() as db:
+            for i in job_ids:
+                db.execute("UPDATE jobs SET lease_until=? WHERE id=? AND node=? AND state='leased'",
+                           (now + LEASE_SEC, i, node))
+            db.execute("UPDATE nodes SET seen=?, busy=? WHERE node=?", (now, len(job_ids), node))
+
+    def defer(self, job_id, node, job: dict, delay):
+        """공간 대기: 임대를 풀고 delay초 뒤(또는 wake() 때) 어느 작업자든 다시 꺼내게 함(임대 횟수는 되돌림)"""
+        now = time.time()
+        with self._tx() as db:
+            db.execute("UPDATE jobs SET state='queued', node=NULL, job=?, not_before=?, leases=MAX(leases-1, 0), "
+                       "updated=? WHERE id=? AND node=?",
+                       (json.dumps(job, ensure_ascii=False), now + delay, now, job_id, node))
+            db.execute("UPDATE nodes SET busy=MAX(busy-1, 0), seen=? WHERE node=?", (now, node))
+
+    def wake(self):
+        with self._tx() as db:
+            db.execute("UPDATE jobs SET not_before=0 WHERE state='queued' AND not_before>0")
+
+    def complete(self, job_id, node, result: dict):
+        now = time.time()
+        with self._tx() as db:
+            db.execute("UPDATE jobs SET state=?, result=?, updated=? WHERE id=? AND node=?",
+                       ("done" if result.get("ok") else "failed", json.dumps(result, ensure_ascii=False),
+                        now, job_id, node))
+            row = db.execute("SELECT throughput, rate403 FROM nodes WHERE node=?", (node,)).fetchone() or (None, 0.0)
+            thr, r403 = row
+            if result.get("bytes") and result.get("seconds"):
+                speed = result["bytes"] / result["seconds"]
+                thr = speed if thr is None else (1 - self.EWMA) * thr + self.EWMA * speed
+            r403 = (1 - self.EWMA) * (r403 or 0.0) + self.EWMA * (1.0 if result.get("http403") else 0.0)
+            db.execute("UPDATE nodes SET throughput=?, rate403=?, done=done+1, busy=MAX(busy-1, 0), seen=? "
+                       "WHERE node=?", (thr, r403, now, node))
+
+    def result(self, job_id):
+        """(상태, 처리한 작업자, 결과 dict) 또는 None"""
+        row = self._db().execute("SELECT state, node, result FROM jobs WHERE id=?", (job_id,)).fetchone()
+        if not row:
+            return None
+        return row[0], row[1], json.loads(row[2]) if row[2] else None
+
+# ---------- 다운로드 엔진(Tk 없이도 동작) ----------
+WORKER_COUNT = 2   # 동시에 처리하는 작업 수(config.json의 "workers"로 변경)
+
+class DownloadEngine:
+    """
+    대기열에서 작업을 꺼내 내려받는 부분. 로그/진행/완료는 msg_q로 알림
+    (Tk 앱은 화면에, 작업자 모드는 콘솔에 출력).
+    store를 SQLiteJobStore로 주면 같은 파일을 쓰는 다른 PC/프로세스와 대기열을 나눠 처리.
+    """
+    def __init__(self, msg_q=None, workers=None, store=None, node=None, outdir=None):
+        cfg = load_config()
+        self.msg_q = msg_q or queue.Queue()
+        self.workers = max(1, int(workers or cfg.get("workers") or WORKER_COUNT))
+        self.bandwidth = BandwidthScheduler.from_config(cfg)
+        self.disk = DiskAdmission()
+        self.archive = DownloadArchive(os.path.join(os.path.dirname(get_config_path()), "archive.json"))
+        self.streams = StreamCache(os.path.join(os.path.dirname(get_config_path()), "streams"),
+                                   int(cfg.get("stream_cache_mb") or STREAM_CACHE_MB) * 1024 * 1024)
+        self.cookies = CookieStore()
+        self.hedge = HedgePolicy(on_hedge=lambda secs: self.msg_q.put((
+            "log", f"[지연] 청크 응답이 {secs:.1f}초째 없어 같은 구간을 한 번 더 요청")))
+        self.prefetch = MetadataPrefetcher(self.build_info_opts, self.on_prefetched, WorkerSession(self.cookies))
+        self.store = store or LocalJobStore()
+        self.node = node or default_node_name()
+        self.outdir = outdir        # 작업의 저장 폴더가 이 PC에 없을 때 대신 쓸 폴더
+        self.active = set()         # 이 엔진이 임대 중인 작업 ID(하트비트로 연장)
+        self.submitted = set()      # 이 엔진이 넣은 작업 ID(다른 작업자가 끝내면 완료 알림)
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.store.register(self.node, self.workers)
+        for _ in range(self.workers):
+            threading.Thread(target=self.worker_loop, daemon=True).start()
+        if self.store.shared:
+            threading.Thread(target=self.heartbeat_loop, daemon=True).start()
+        return self
+
+    def submit(self, url, outdir, mode, filename, res_preset, priority="normal"):
+        job_id = self.store.put({"url": url, "outdir": outdir, "mode": mode, "filename": filename,
+                                 "res_preset": res_preset, "priority": priority}, priority)
+        if self.store.shared:
+            with self.lock:
+                self.submitted.add(job_id)
+            self.msg_q.put(("log", f"[분산] 작업 #{job_id} 대기열 등록"))
+        return job_id
+
+    def on_prefetched(self, url, info, sizes, err):
+        self.msg_q.put(("meta", {"url": url, "info": info, "sizes": sizes, "err": err}))
+
+    # yt-dlp 진행 콜백
+    def ydl_progress_hook(self, d, lane=None, track=None):
+        try:
+            if d.get('status') == 'downloading':
+                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
+                downloaded = d.get('downloaded_bytes') or 0
+                percent = (downloaded / total * 100) if total else 0
+                speed = d.get('speed'); eta = d.get('eta')
+                if lane is not None:
+                    self.bandwidth.throttle(lane, downloaded, speed)
+                if track is not None and d.get('tmpfilename'):
+                    track.hasher.feed(d['tmpfilename'], downloaded)
+                txt = []
+                if total: txt.append(f"{percent:.1f}%")
+                if speed: txt.append(f"{speed/1024/1024:.2f} MB/s")
+                if eta:   txt.append(f"ETA {int(eta)}s")
+                if txt:   self.msg_q.put(("log", "[진행] " + " | ".join(txt)))
+                self.msg_q.put(("progress", percent))
+            elif d.get('status') == 'finished':
+                # ★ yt-dlp가 알려주는 실제 생성 파일 경로와 해시를 기억
+                info = d.get('info_dict') or {}
+                path = d.get('filename') or info.get('_filename')
+                if track is not None and path:
+                    track.finished(path, d.get('total_bytes') or d.get('downloaded_bytes'),
+                                   (info.get('id'), info.get('format_id')))
+                self.msg_q.put(("progress", 100.0))
+                self.msg_q.put(("log", "[처리 중] 후처리 진행..."))
+        except Exception:
+            pass
+
+    # yt-dlp 후처리 콜백
+    def ydl_pp_hook(self, d, track=None):
+        """keepvideo로 yt-dlp가 지우지 않은 파일(원본 스트림 + 변환 전 병합본 등)도 정리 대상으로 등록"""
+        try:
+            if (track is not None and d.get("status") == "started"
+                    and d.get("postprocessor") == "MoveFiles"):
+                moves = (d.get("info_dict") or {}).get("__files_to_move") or {}
+                track.kept([p for p, dest in moves.items() if not dest])
+        except Exception:
+            pass
+
+    # ---- yt-dlp 옵션(403 완화 + cookies.txt) ----
+    def build_ydl_opts(self, outpath, mode, ffdir, fmt_str, recode_to_mp4=False, lane=None, track=None):
+        UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
+
+        ydl_opts = {
+            "outtmpl": outpath,
+            "noprogress": True,
+            "progress_hooks": [functools.partial(self.ydl_progress_hook, lane=lane, track=track)],
+            "postprocessor_hooks": [functools.partial(self.ydl_pp_hook, track=track)],
+            "noplaylist": True,
+            "windowsfilenames": True,
+
+            # 네트워크/재시도(403 완화)
+            "retries": 20,
+            "fragment_retries": 20,
+            "source_address": "0.0.0.0",        # IPv4 강제
+            "concurrent_fragment_downloads": 1, # 동시 조각 1개
+            "http_chunk_size": 2 * 1024 * 1024, # 2MB
+            "retry_sleep_functions": {
+                "http": ["exponential", 1, 2, 10],
+                "fragment": ["exponential", 1, 2, 10],
+            },
+
+            # 포맷
+            "format": fmt_str,
+            "format_sort": FORMAT_SORT,
+            "format_sort_force": True,
+
+            # YouTube extractor 튜닝
+            "extractor_retries": 5,
+            "extractor_args": {
+                "youtube": {
+                    "player_client": ["android", "web"],
+                    "po_token": ["1"],
+                }
+            },
+
+            # 브라우저 유사 헤더
+            "http_headers": {
+                "User-Agent": UA,
+                "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
+            },
+        }
+
+        if ffdir:
+            ydl_opts["ffmpeg_location"] = ffdir
+
+        # 작업 한도는 yt-dlp 자체 ratelimit로도 걸어 둠(공유 몫은 진행 훅에서 조절)
+        if lane is not None and lane.limit:
+            ydl_opts["ratelimit"] = lane.limit
+
+        # 쿠키는 cookiefile 대신 WorkerSession이 공유 jar를 직접 꽂음(작업마다 다시 파싱하지 않도록)
+
+        if mode == "audio":
+            ydl_opts.update({
+                "postprocessors": [
+                    {"key": "FFmpegExtractAudio", "preferredcodec": "m4a", "preferredquality": "0"}
+                ],
+                "format": "bestaudio/best",
+            })
+        else:
+            # 병합 후에도 원본 스트림을 남겨 두면, 후처리만 실패했을 때 다시 받지 않고 재병합 가능
+            ydl_opts["keepvideo"] = True
+            if recode_to_mp4:
+                ydl_opts["recodevideo"] = "mp4"
+                ydl_opts["postprocessor_args"] = {
+                    "FFmpegVideoConvertor": ["-c:v", "libx264", "-pix_fmt", "yuv420p",
+                                             "-c:a", "aac", "-movflags", "+faststart"]
+                }
+            else:
+                ydl_opts["merge_output_format"] = "mp4"
+                ydl_opts["postprocessor_args"] = ["-c:v", "copy", "-c:a", "aac"]
+
+        return ydl_opts
+
+    def build_info_opts(self):
+        """메타 추출용: 다운로드와 같은 네트워크/extractor 설정(추출한 info를 다운로드에 그대로 쓰도록)"""
+        opts = self.build_ydl_opts(None, "video", None, "bestvideo*+bestaudio/best")
+        for k in ("outtmpl", "progress_hooks", "postprocessor_hooks", "postprocessors", "postprocessor_args",
+                  "merge_output_format", "keepvideo", "recodevideo"):
+            opts.pop(k, None)
+        opts.update({"quiet": True, "no_warnings": True})
+        return opts
+
+    def seed_streams(self, info, ydl_opts, final_path, track):
+        """
+        이 작업이 이미 받은 원본 스트림(앞 단계 시도) 또는 캐시에 있는 것을 yt-dlp가 받을 자리에 놓아,
+        그 트랙은 다운로드를 건너뛰게 함(단계마다 병합 확장자가 달라 자리 이름도 달라짐)
+        """
+        try:
+            parts = stream_paths(info, ydl_opts["format"], final_path, ydl_opts.get("merge_output_format"))
+        except Exception:
+            return
+        for f, dest in parts:
+            if not f.get("format_id") or os.path.exists(dest):
+                continue
+            key = (info.get("id"), f["format_id"])
+            held = next((p for p, k in track.formats.items()
+                         if k == key and p != dest and os.path.exists(p) and track.intact(p)), None)
+            if held:
+                track.move(held, dest)
+                self.msg_q.put(("log", f"[재사용] 포맷 {f['format_id']} 앞 단계에서 받은 것 사용"))
+                continue
+            got = self.streams.materialize(*key, dest, f.get("filesize"))
+            if got:
+                track.adopt(dest, got, key)
+                self.msg_q.put(("log", f"[캐시] 포맷 {f['format_id']} 재사용({format_size(got[0])})"))
+
+    def record_output(self, vid, path, mode, title, best_height=None, ffdir=None):
+        """완료된 결과물을 archive.json에 기록(나중에 로컬 파생의 원본으로 사용)"""
+        if not vid:
+            return
+        info = probe_media(path, ffdir) or {}
+        self.archive.add(vid, {
+            "path": os.path.abspath(path), "mode": mode, "title": title,
+            "height": info.get("height"), "best_height": best_height,
+            "has_audio": "audio" in (info.get("streams") or {"audio"}), "time": time.time(),
+        })
+
+    def derive_local(self, url, outdir, mode, filename, res_preset, ffdir):
+        """이미 받은 같은 영상이 있으면 네트워크 없이 ffmpeg로 바로 만듦(성공 시 완료 결과)"""
+        vid = youtube_id(url)
+        cap = FORMAT_PRESETS.get(res_preset, FORMAT_PRESETS["high"])[1]
+        srcs = self.archive.sources(vid) if vid else []
+        if mode == "audio":
+            srcs = sorted((r for r in srcs if r.get("has_audio")), key=lambda r: r["mode"] != "audio")
+        else:
+            # 원하는 해상도(또는 원래 영상의 최고 해상도) 이상인 것 중 가장 작은 것
+            srcs = sorted((r for r in srcs if r["mode"] == "video"
+                           and (r.get("height") or 0) >= min(cap, r.get("best_height") or cap)),
+                          key=lambda r: r.get("height") or 0)
+        for rec in srcs:
+            res_prefix = RES_LABEL.get(res_preset, "") if mode == "video" else ""
+            ext = "m4a" if mode == "audio" else "mp4"
+            final_path = unique_path(outdir, f"{res_prefix}{sanitize_filename(filename or rec.get('title') or vid)}", ext)
+            self.msg_q.put(("log", f"[로컬 파생] {rec['path']} → {final_path}"))
+            ok, msg = derive_media(rec["path"], final_path, mode, cap if mode == "video" else None, ffdir)
+            if ok:
+                self.record_output(vid, final_path, mode, rec.get("title"), rec.get("best_height"), ffdir)
+                self.msg_q.put(("progress", 100.0))
+                return {"ok": True, "path": final_path, "check": f"로컬 파생, {msg}"}
+            self.msg_q.put(("log", f" - 로컬 파생 실패({msg}), 다른 원본 또는 다운로드로 진행"))
+        return None
+
+    def _try(self, idx, total, msg):
+        self.msg_q.put(("log", f"[자동 호환성 검사] {idx}/{total} - {msg}"))
+
+    def worker_loop(self):
+        """작업 스레드: 저장소에서 작업을 임대해 같은 세션(쿠키/연결)으로 차례로 처리"""
+        session = WorkerSession(self.cookies, self.hedge)
+        backoff = 0
+        while True:
+            try:
+                got = self.store.lease(self.node)
+            except Exception as e:   # DB 잠김(시간 초과)/네트워크 공유 끊김 — 작업자를 잃지 않고 잠시 뒤 다시
+                if not backoff:
+                    self.msg_q.put(("log", f"[분산] 작업 임대 실패, 다시 시도합니다: {e}"))
+                backoff = min(max(backoff * 2, 1), LEASE_RETRY_MAX)
+                time.sleep(backoff)
+                continue
+            if backoff:
+                self.msg_q.put(("log", "[분산] 저장소 접근 복구"))
+                backoff = 0
+            if not got:
+                continue
+            job_id, job = got
+            waiting = job.pop("disk_wait", False)   # 이미 공간 대기 안내를 한 작업
+            with self.lock:
+                self.active.add(job_id)
+            if self.store.shared:
+                self.msg_q.put(("log", f"[분산] 작업 #{job_id} 시작 ({self.node})"))
+            if not os.path.isdir(job["outdir"]) and self.outdir:
+                job["outdir"] = self.outdir
+            try:
+                if not os.path.isdir(job["outdir"]):
+                    raise Exception(f"저장 폴더가 이 PC에 없습니다: {job['outdir']}")
+                result = self.download_worker(**job, session=session)
+            except DiskWait as w:
+                result = None
+                if not waiting:
+                    self.msg_q.put(("log", f"[대기] {w} → 공간이 확보되면 자동으로 시작합니다."))
+                if w.info:
+                    self.prefetch.keep(job["url"], w.info, w.info_at)
+            except Exception as e:
+                result = {"ok": False, "msg": str(e)}
+                self.msg_q.put(("done", result))
+            with self.lock:
+                self.active.discard(job_id)
+                if result is not None:
+                    self.submitted.discard(job_id)    # 직접 끝낸 작업은 완료 알림을 이미 보냄
+            try:
+                if result is None:
+                    self.store.defer(job_id, self.node, dict(job, disk_wait=True), self.disk.RECHECK_SEC)
+                else:
+                    self.store.complete(job_id, self.node, result)
+            except Exception as e:
+                self.msg_q.put(("log", f"[분산] 작업 #{job_id} 결과 기록 실패: {e}"))
+
+    def heartbeat_loop(self):
+        """임대 연장(하트비트) + 내가 넣었지만 다른 작업자가 끝낸 작업의 완료 알림"""
+        beat = 0.0
+        while True:
+            time.sleep(2)
+            with self.lock:
+                active, submitted = list(self.active), list(self.submitted)
+            try:
+                if time.monotonic() - beat >= HEARTBEAT_SEC:
+                    self.store.renew(self.node, active)
+                    beat = time.monotonic()
+                for job_id in submitted:
+                    got = self.store.result(job_id)
+                    if not got or got[0] not in ("done", "failed"):
+                        continue
+                    with self.lock:
+                        if job_id not in self.submitted:
+                            continue
+                        self.submitted.discard(job_id)
+                    state, node, result = got
+                    self.msg_q.put(("log", f"[분산] 작업 #{job_id}: {node}에서 처리됨"))
+                    # 경로는 그 작업자 PC 기준이라 여기서 존재 확인을 하지 않도록 따로 알림
+                    self.msg_q.put(("remote_done", dict(result or {"ok": False, "msg": "결과 없음"}, node=node)))
+            except Exception as e:
+                self.msg_q.put(("log", f"[분산] 저장소 접근 실패: {e}"))
+
+    def download_worker(self, url, outdir, mode, filename, res_preset, priority="normal", session=None):
+        """작업 하나 처리. 완료 알림을 보내고 저장소에 남길 결과(처리량/403 통계 포함)를 돌려줌"""
+        with profile_job(f"{youtube_id(url) or url}-{mode}-{res_preset}"):
+            return self._download(url, outdir, mode, filename, res_preset, priority, session)
+
+    def _download(self, url, outdir, mode, filename, res_preset, priority="normal", session=None):
+        session = session or WorkerSession(self.cookies, self.hedge)
+        lane = None
+        ticket = {}
+        track = JobTrack()
+        started = time.monotonic()
+        http403 = False
+
+        def finish(result):
+            self.msg_q.put(("done", result))
+            return dict(result, bytes=track.received, seconds=time.monotonic() - started, http403=http403)
+
+        try:
+            ffdir = ensure_ffmpeg_on_path()
+
+            # 라이브러리에 같은 영상이 있으면 YouTube에 다시 가지 않고 로컬에서 만듦
+            profile_phase("local")
+            result = self.derive_local(url, outdir, mode, filename, res_preset, ffdir)
+            if result:
+                return finish(result)
+
+            # 메타 추출(playlist 방지) — 선읽기가 있으면 그 info를 그대로 사용
+            profile_phase("meta")
+            info, info_at = self.prefetch.take(url)
+            if info:
+                self.msg_q.put(("log", "[메타] 미리 읽은 영상 정보 사용"))
+            else:
+                with session.open(self.build_info_opts()) as info_ydl:
+                    info = info_ydl.extract_info(url, download=False)
+                info_at = time.monotonic()
+            title = info.get('title') or info.get('id') or 'video'
+            vurl  = info.get('webpage_url') or url
+
+            # 파일명(최종 확장자 기준) + 중복 넘버링
+            res_prefix = RES_LABEL.get(res_preset, "")
+            ext = "m4a" if mode == "audio" else "mp4"
+            base = f"{res_prefix}{sanitize_filename(filename or title)}"
+            final_path = unique_path(outdir, base, ext)
+            self.msg_q.put(("log", f"[저장 경로] {final_path}"))
+
+            cap_fmt, _ = FORMAT_PRESETS.get(res_preset, FORMAT_PRESETS["high"])
+
+            # 폴백 단계
+            attempts = []
+            if mode == "video":
+                attempts.append( (f"{cap_fmt}[vcodec^=avc1]+ba[acodec^=mp4a]", False, "H.264+AAC(가능하면) 우선") )
+                attempts.append( (f"{cap_fmt}+ba/best", True, "코덱 무관 수집 → mp4 변환") )
+                attempts.append( ("bv*[height<=720]+ba/best", True, "720p 이하 폴백 → mp4 변환") )
+                attempts.append( ("bestvideo*+bestaudio/best", True, "최후 폴백 → mp4 변환") )
+            else:
+                attempts.append( ("bestaudio/best", False, "최적 오디오(m4a 추출)") )
+
+            profile_phase("disk_wait")
+            # 사전 용량 추정 → 스테이징(원본/중간 파일)과 출력 볼륨에 자리가 날 때까지 대기
+            need = estimate_footprint(info, mode, [a[0] for a in attempts])
+            if need:
+                self.msg_q.put(("log", f"[공간] 예상 최대 사용량 {format_size(sum(need.values()))}"
+                                       f" (원본 {format_size(need['parts'])})"))
+                staging = os.path.dirname(final_path)
+                try:
+                    ticket = self.disk.admit([(staging, need["parts"] + need["temp"]), (outdir, need["final"])])
+                except DiskWait as w:
+                    w.info, w.info_at = info, info_at
+                    raise
+            else:
+                self.msg_q.put(("log", "[공간] 포맷 크기 정보가 없어 용량 확인 없이 진행"))
+
+            # 대기열을 통과한 뒤에 대역폭 몫을 받음(대기 중인 작업이 몫을 차지하지 않도록)
+            lane = self.bandwidth.open(priority)
+            self.msg_q.put(("log", f"[대역폭] 우선순위 {PRIORITY_LABEL[lane.priority]}"
+                                   + (f", 작업 한도 {lane.limit/1024/1024:.2f} MB/s" if lane.limit else "")))
+
+            want = {"audio"} if mode == "audio" else {"video", "audio"}
+            duration = info.get('duration')
+
+            total = len(attempts)
+            last_err = None
+            for i, (fmt, recode, desc) in enumerate(attempts, start=1):
+                try:
+                    self._try(i, total, desc)
+                    ydl_opts = self.build_ydl_opts(final_path, mode, ffdir, fmt, recode_to_mp4=recode,
+                                                   lane=lane, track=track)
+                    self.seed_streams(info, ydl_opts, final_path, track)
+                    # 검증 실패 시 같은 단계에서 실패한 부분(다운로드 또는 후처리)만 한 번 더
+                    for retry in range(2):
+                        track.begin()
+                        profile_phase("download")
+                        with session.open(ydl_opts) as ydl:
+                            if time.monotonic() - info_at < PREFETCH_TTL:
+                                ydl.process_ie_result(reselectable(info), download=True)   # 재추출 없음
+                            else:
+                                ydl.download([vurl])
+                        profile_phase("verify")
+
+                        # ---- 결과 검증(보강: 생성된 파일을 우선 인정) ----
+                        candidates = [final_path]
+                        if track.last_path:
+                            candidates.append(track.last_path)
+                        neighbor = find_neighbor_output(outdir, os.path.splitext(os.path.basename(final_path))[0])
+                        if neighbor:
+                            candidates.append(neighbor)
+
+                        picked = next((p for p in candidates
+                                       if p and os.path.exists(p) and os.path.getsize(p) > 0), None)
+
+                        ok, why = verify_media(picked, want, duration, ffdir)
+                        if ok:
+                            for p, (size, digest) in track.hashes.items():
+                                if os.path.exists(p):
+                                    self.msg_q.put(("log", f"[sha256] {os.path.basename(p)} {digest}"))
+                            track.cleanup(keep=picked, cache=self.streams)
+                            self.record_output(info.get('id'), picked, mode, title,
+                                               max((f.get('height') or 0 for f in info.get('formats') or []), default=0) or None,
+                                               ffdir)
+                            return finish({"ok": True, "path": picked, "check": why})
+
+                        # 원본 스트림이 멀쩡하면 후처리(병합/변환)만, 아니면 망가진 스트림만 다시 받음
+                        bad = [p for p in track.current if p != picked and not
+                               (track.intact(p) and verify_media(p, (), duration, ffdir)[0])]
+                        redownload = bool(bad) or picked in track.current or not track.current
+                        self.msg_q.put(("log", f" - 검증 실패({why}) → "
+                                               + ("다운로드" if redownload else "후처리") + " 단계 재시도"))
+                        for p in bad:
+                            if p in track.formats:
+                                self.streams.forget(*track.formats[p])   # 캐시에서 온 것이면 캐시도 무효화
+                            track.discard(p)
+                        if picked == final_path or picked in track.current:
+                            track.discard(picked)
+
+                    # 여기까지 못 찾았으면 다음 단계 시도
+                    raise Exception(f"다운로드/후처리 후 파일 검증 실패: {why}")
+
+                except Exception as e:
+                    last_err = e
+                    http403 = http403 or "403" in str(e)
+                    self.msg_q.put(("log", " - 불가, 다음 단계로 진행"))
+
+            raise last_err if last_err else Exception("다운로드 가능한 형식을 찾지 못했습니다.")
+
+        except DiskWait:
+            raise
+        except Exception as e:
+            self.msg_q.put(("log", f"[에러] {e}\n" + traceback.format_exc(limit=2)))
+            if not IS_FROZEN:
+                self.msg_q.put(("log", "[안내] yt-dlp를 최신으로 업데이트해 보세요:  pip install -U yt-dlp"))
+            else:
+                self.msg_q.put(("log", "[안내] yt-dlp 업데이트가 필요할 수 있습니다. 최신 yt-dlp로 EXE를 재빌드하세요."))
+            http403 = http403 or "403" in str(e)
+            return finish({"ok": False, "msg": str(e)})
+        finally:
+            track.cleanup(cache=self.streams)   # 실패로 끝났으면 남은 원본 스트림 정리(성공 시에는 이미 비어 있음)
+            self.disk.release(ticket)
+            if ticket:
+                try:
+                    self.store.wake()   # 공간을 기다리며 대기열로 돌아간 작업이 바로 다시 시도하도록
+                except Exception:
+                    pass
+            self.cookies.save()
+            if lane is not None:
+                self.bandwidth.close(lane)
+
 # ---------- 앱 ----------
+LOG_MAX_LINES = 2000   # 로그 창에 남기는 최대 줄 수(며칠씩 켜 둘 때 메모리가 계속 늘지 않도록)
+
 class App(tk.Tk):
-    def __init__(self):
+    def __init__(self, store=None):
         super().__init__()
         self.title("아랑의 Youtube 다운로더 v1.2.3")
-        self.geometry("420x640")
+        self.geometry("420x690")
         self.minsize(360, 520)
         self.resizable(True, True)
 
         self.msg_q = queue.Queue()
         self.current_dir = ""
-        self.last_finished_path = None   # ★ 진행 훅이 보고한 실제 생성 파일 경로
+        self.engine = DownloadEngine(self.msg_q, store=store).start()
+        self._last_clip = ""
+        self._url_after = None
 
         # URL + 시작 버튼
         frm_url = ttk.Frame(self); frm_url.pack(fill="x", padx=10, pady=(10,6))
@@ -196,6 +2379,10 @@ class App(tk.Tk):
         self.ent_url = ttk.Entry(row); self.ent_url.pack(side="left", fill="x", expand=True)
         self.btn_start = ttk.Button(row, text="다운로드 시작", command=self.on_start)
         self.btn_start.pack(side="left", padx=6)
+        self.lbl_meta = ttk.Label(frm_url, text="", foreground="gray", wraplength=390, justify="left")
+        self.lbl_meta.pack(side="top", anchor="w", fill="x")
+        self.ent_url.bind("<KeyRelease>", self.on_url_edit)
+        self.ent_url.bind("<<Paste>>", self.on_url_edit, add="+")
 
         # 저장 폴더
         frm_dir = ttk.Frame(self); frm_dir.pack(fill="x", padx=10, pady=6)
@@ -227,6 +2414,12 @@ class App(tk.Tk):
         for w in (self.rb_high, self.rb_med, self.rb_low):
             w.pack(side="left", padx=8, pady=4)
 
+        grp_pri = ttk.LabelFrame(self, text="우선순위"); grp_pri.pack(fill="x", padx=10, pady=(0,8))
+        self.priority = tk.StringVar(value="normal")
+        for key in ("high", "normal", "low"):
+            ttk.Radiobutton(grp_pri, text=PRIORITY_LABEL[key], value=key,
+                            variable=self.priority).pack(side="left", padx=8, pady=4)
+
         # 진행률/로그
         frm_prog = ttk.Frame(self); frm_prog.pack(fill="x", padx=10, pady=(4,0))
         self.pbar = ttk.Progressbar(frm_prog, mode="determinate", maximum=100, value=0)
@@ -240,6 +2433,8 @@ class App(tk.Tk):
         # 하단
         frm_btn = ttk.Frame(self); frm_btn.pack(fill="x", padx=10, pady=8)
         ttk.Button(frm_btn, text="끝내기", command=self.destroy).pack(side="right")
+        self.btn_bulk = ttk.Button(frm_btn, text="폴더 일괄 변환", command=self.on_bulk_derive)
+        self.btn_bulk.pack(side="left")
 
         # 초기화
         last_dir = load_last_dir()
@@ -261,6 +2456,7 @@ class App(tk.Tk):
         self.toggle_res_opts()
 
         self.after(100, self.process_messages)
+        self.after(1000, self.watch_clipboard)
 
     # ---------- 디렉터리 ----------
     def set_current_dir(self, d: str):
@@ -273,6 +2469,9 @@ class App(tk.Tk):
         text = "\n".join(str(x) for x in lines)
         self.txt_log.configure(state="normal")
         self.txt_log.insert("end", text + ("" if text.endswith("\n") else "\n"))
+        extra = int(self.txt_log.index("end-1c").split(".")[0]) - LOG_MAX_LINES
+        if extra > 0:
+            self.txt_log.delete("1.0", f"{extra + 1}.0")
         self.txt_log.see("end")
         self.txt_log.configure(state="disabled")
 
@@ -285,10 +2484,54 @@ class App(tk.Tk):
             return
         try:
             clip = pyperclip.paste().strip()
+            self._last_clip = clip
             if clip and YOUTUBE_REGEX.search(clip):
                 self.ent_url.delete(0, "end"); self.ent_url.insert(0, clip)
+                self.prefetch_url()
+        except Exception:
+            pass
+
+    # ---------- 메타데이터 선읽기 ----------
+    def watch_clipboard(self):
+        """새로 복사된 YouTube URL은 (입력칸이 비었거나 이전 클립보드 그대로면) 채우고 선읽기"""
+        try:
+            clip = pyperclip.paste().strip() if pyperclip else ""
+            if clip and clip != self._last_clip and YOUTUBE_REGEX.search(clip):
+                cur = self.ent_url.get().strip()
+                if not cur or cur == self._last_clip:
+                    self.ent_url.delete(0, "end"); self.ent_url.insert(0, clip)
+                    self.prefetch_url()
+            self._last_clip = clip
         except Exception:
             pass
+        self.after(1000, self.watch_clipboard)
+
+    def on_url_edit(self, _event=None):
+        if self._url_after:
+            self.after_cancel(self._url_after)
+        self._url_after = self.after(600, self.prefetch_url)
+
+    def prefetch_url(self):
+        self._url_after = None
+        url = self.ent_url.get().strip()
+        if url and YOUTUBE_REGEX.search(url):
+            self.lbl_meta.config(text="(영상 정보 읽는 중...)")
+            self.engine.prefetch.request(url)
+        else:
+            self.lbl_meta.config(text="")
+
+    def show_meta(self, payload):
+        if normalize_youtube_url(self.ent_url.get().strip()) != payload["url"]:
+            return   # 그 사이 URL이 바뀜
+        info = payload["info"]
+        if not info:
+            self.lbl_meta.config(text=f"(영상 정보를 읽지 못했습니다: {payload['err']})")
+            return
+        sizes = payload["sizes"]
+        est = " / ".join(f"{lbl} {format_size(sizes.get(k))}"
+                         for k, lbl in (("high", "상"), ("medium", "중"), ("low", "하"), ("audio", "음성")))
+        self.lbl_meta.config(text=f"{info.get('title') or info.get('id')}  [{format_duration(info.get('duration'))}]\n"
+                                  f"예상 크기: {est}")
 
     def toggle_res_opts(self):
         state = "!disabled" if self.mode.get() == "video" else "disabled"
@@ -336,33 +2579,76 @@ class App(tk.Tk):
             messagebox.showerror("ffmpeg 필요", "ffmpeg.exe를 같은 폴더에 두거나 PATH에 등록하세요.")
             return
 
-        # ★ 이전 기록 초기화
-        self.last_finished_path = None
-
-        ck = find_cookie_file()
+        ck = self.engine.cookies.locate()
         if ck:
             self.msg_q.put(("log", f"[쿠키] {ck} 사용"))
 
         self.set_progress(0)
         self.log("다운로드를 시작합니다...")
-        threading.Thread(
-            target=self.download_worker,
-            args=(url, outdir, self.mode.get(), filename, self.res_preset.get()),
-            daemon=True
-        ).start()
+        self.engine.submit(url, outdir, self.mode.get(), filename, self.res_preset.get(), self.priority.get())
+
+    def on_bulk_derive(self):
+        outdir = self.current_dir or self.lbl_dir.cget("text")
+        if outdir in ("", "(미선택)") or not os.path.isdir(outdir):
+            messagebox.showerror("오류", "저장할 폴더를 선택하세요.")
+            return
+        ffdir = ensure_ffmpeg_on_path()
+        if not ffdir and not _ffmpeg_in_path():
+            prompt_ffmpeg_download()
+            return
+        mode, res = self.mode.get(), self.res_preset.get()
+        what = "음성(m4a) 추출" if mode == "audio" else f"{RES_LABEL.get(res, '').strip()} 이하로 축소"
+        if not messagebox.askyesno("폴더 일괄 변환", f"저장 폴더의 영상들을 네트워크 없이 {what}합니다.\n\n{outdir}\n\n진행할까요?"):
+            return
+        self.btn_bulk.state(["disabled"])
+        self.log(f"[일괄 변환] {what} 시작...")
+        threading.Thread(target=self.bulk_worker, args=(outdir, mode, res, ffdir), daemon=True).start()
+
+    def bulk_worker(self, outdir, mode, res, ffdir):
+        counts = {True: 0, False: 0, None: 0}
+        def on_result(src, dest, ok, msg):
+            counts[ok] += 1
+            if ok:   # 원본이 기록된 영상이면 결과물도 기록해 이후 작업의 로컬 원본으로 씀
+                vid, rec = self.engine.archive.by_path(src)
+                if vid:
+                    self.engine.record_output(vid, dest, mode, rec.get("title"), rec.get("best_height"), ffdir)
+            tag = {True: "완료", False: "실패", None: "건너뜀"}[ok]
+            self.msg_q.put(("log", f"[{tag}] {os.path.basename(src)} → {os.path.basename(dest)} ({msg})"))
+        try:
+            n = derive_folder(outdir, mode, res, ffdir, on_result)
+            self.msg_q.put(("log", f"[일괄 변환] 대상 {n}개: 완료 {counts[True]} / 실패 {counts[False]} / 건너뜀 {counts[None]}"))
+        except Exception as e:
+            self.msg_q.put(("log", f"[일괄 변환 실패] {e}"))
+        self.msg_q.put(("bulk_done", None))
 
     def process_messages(self):
         try:
             while True:
                 kind, payload = self.msg_q.get_nowait()
+                t0 = time.perf_counter()
                 if kind == "log":
                     self.log(payload)
                 elif kind == "progress":
                     self.set_progress(payload)
+                elif kind == "meta":
+                    self.show_meta(payload)
+                elif kind == "remote_done":
+                    where = f"{payload['node']}: {payload.get('path')}"
+                    if payload.get("ok"):
+                        self.log(f"[완료] (다른 작업자) {where}")
+                        messagebox.showinfo("완료", f"다른 작업자가 다운로드를 완료했습니다.\n{where}")
+                    else:
+                        self.log(f"[실패] (다른 작업자 {payload['node']}) {payload.get('msg', '다운로드 실패')}")
+                        messagebox.showerror("실패", payload.get("msg", "다운로드 실패"))
+                elif kind == "bulk_done":
+                    self.btn_bulk.state(["!disabled"])
                 elif kind == "done":
                     if payload.get("ok"):
                         final = payload.get("path")
-                        if final and os.path.exists(final) and os.path.getsize(final) > 0:
+                        # 내용 검증은 작업 스레드(verify_media)에서 끝났으므로 여기서는 존재만 확인
+                        if final and os.path.exists(final):
+                            if payload.get("check"):
+                                self.log(f"[검증] {payload['check']}")
                             self.log(f"[완료] {final}")
                             messagebox.showinfo("완료", f"다운로드가 완료되었습니다.\n{final}")
                         else:
@@ -371,180 +2657,303 @@ class App(tk.Tk):
                     else:
                         self.log(payload.get("msg", "다운로드 실패"))
                         messagebox.showerror("실패", payload.get("msg", "다운로드 실패"))
+                profile_ui(kind, time.perf_counter() - t0)   # "done"은 완료 창이 떠 있던 시간 포함
                 self.msg_q.task_done()
         except queue.Empty:
             pass
         self.after(100, self.process_messages)
 
-    # yt-dlp 진행 콜백
-    def ydl_progress_hook(self, d):
-        try:
-            if d.get('status') == 'downloading':
-                total = d.get('total_bytes') or d.get('total_bytes_estimate') or 0
-                downloaded = d.get('downloaded_bytes') or 0
-                percent = (downloaded / total * 100) if total else 0
-                speed = d.get('speed'); eta = d.get('eta')
-                txt = []
-                if total: txt.append(f"{percent:.1f}%")
-                if speed: txt.append(f"{speed/1024/1024:.2f} MB/s")
-                if eta:   txt.append(f"ETA {int(eta)}s")
-                if txt:   self.msg_q.put(("log", "[진행] " + " | ".join(txt)))
-                self.msg_q.put(("progress", percent))
-            elif d.get('status') == 'finished':
-                # ★ yt-dlp가 알려주는 실제 생성 파일 경로를 기억
-                self.last_finished_path = d.get('filename') or (d.get('info_dict') or {}).get('_filename')
-                self.msg_q.put(("progress", 100.0))
-                self.msg_q.put(("log", "[처리 중] 후처리 진행..."))
-        except Exception:
-            pass
-
-    # ---- yt-dlp 옵션(403 완화 + cookies.txt) ----
-    def build_ydl_opts(self, outpath, mode, ffdir, fmt_str, recode_to_mp4=False):
-        UA = ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-              "(KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36")
-
-        ydl_opts = {
-            "outtmpl": outpath,
-            "noprogress": True,
-            "progress_hooks": [self.ydl_progress_hook],
-            "noplaylist": True,
-            "windowsfilenames": True,
-
-            # 네트워크/재시도(403 완화)
-            "retries": 20,
-            "fragment_retries": 20,
-            "source_address": "0.0.0.0",        # IPv4 강제
-            "concurrent_fragment_downloads": 1, # 동시 조각 1개
-            "http_chunk_size": 2 * 1024 * 1024, # 2MB
-            "retry_sleep_functions": {
-                "http": ["exponential", 1, 2, 10],
-                "fragment": ["exponential", 1, 2, 10],
-            },
-
-            # 포맷
-            "format": fmt_str,
-            "format_sort": ["res", "br", "vcodec:avc1", "acodec:mp4a", "ext:mp4:m4a"],
-            "format_sort_force": True,
-
-            # YouTube extractor 튜닝
-            "extractor_retries": 5,
-            "extractor_args": {
-                "youtube": {
-                    "player_client": ["android", "web"],
-                    "po_token": ["1"],
-                }
-            },
-
-            # 브라우저 유사 헤더
-            "http_headers": {
-                "User-Agent": UA,
-                "Accept-Language": "ko-KR,ko;q=0.9,en-US;q=0.8,en;q=0.7",
-            },
-        }
-
-        if ffdir:
-            ydl_opts["ffmpeg_location"] = ffdir
-
-        ck = find_cookie_file()
-        if ck:
-            ydl_opts["cookiefile"] = ck
-
-        if mode == "audio":
-            ydl_opts.update({
-                "postprocessors": [
-                    {"key": "FFmpegExtractAudio", "preferredcodec": "m4a", "preferredquality": "0"}
-                ],
-                "format": "bestaudio/best",
-            })
-        else:
-            if recode_to_mp4:
-                ydl_opts["recodevideo"] = "mp4"
-                ydl_opts["postprocessor_args"] = {
-                    "FFmpegVideoConvertor": ["-c:v", "libx264", "-pix_fmt", "yuv420p",
-                                             "-c:a", "aac", "-movflags", "+faststart"]
-                }
-            else:
-                ydl_opts["merge_output_format"] = "mp4"
-                ydl_opts["postprocessor_args"] = ["-c:v", "copy", "-c:a", "aac"]
-
-        return ydl_opts
-
-    def _try(self, idx, total, msg):
-        self.msg_q.put(("log", f"[자동 호환성 검사] {idx}/{total} - {msg}"))
-
-    def download_worker(self, url, outdir, mode, filename, res_preset):
-        try:
-            ffdir = ensure_ffmpeg_on_path()
-
-            # 메타 추출(playlist 방지)
-            with YoutubeDL({"quiet": True, "noplaylist": True}) as info_ydl:
-                info = info_ydl.extract_info(url, download=False)
-            title = info.get('title') or info.get('id') or 'video'
-            vurl  = info.get('webpage_url') or url
-
-            # 파일명(최종 확장자 기준) + 중복 넘버링
-            res_prefix = RES_LABEL.get(res_preset, "")
-            ext = "m4a" if mode == "audio" else "mp4"
-            base = f"{res_prefix}{sanitize_filename(filename or title)}"
-            final_path = unique_path(outdir, base, ext)
-            self.msg_q.put(("log", f"[저장 경로] {final_path}"))
-
-            cap_fmt, _ = FORMAT_PRESETS.get(res_preset, FORMAT_PRESETS["high"])
-
-            # 폴백 단계
-            attempts = []
-            if mode == "video":
-                attempts.append( (f"{cap_fmt}[vcodec^=avc1]+ba[acodec^=mp4a]", False, "H.264+AAC(가능하면) 우선") )
-                attempts.append( (f"{cap_fmt}+ba/best", True, "코덱 무관 수집 → mp4 변환") )
-                attempts.append( ("bv*[height<=720]+ba/best", True, "720p 이하 폴백 → mp4 변환") )
-                attempts.append( ("bestvideo*+bestaudio/best", True, "최후 폴백 → mp4 변환") )
-            else:
-                attempts.append( ("bestaudio/best", False, "최적 오디오(m4a 추출)") )
-
-            total = len(attempts)
-            last_err = None
-            for i, (fmt, recode, desc) in enumerate(attempts, start=1):
-                try:
-                    self._try(i, total, desc)
-                    ydl_opts = self.build_ydl_opts(final_path, mode, ffdir, fmt, recode_to_mp4=recode)
-                    with YoutubeDL(ydl_opts) as ydl:
-                        ydl.download([vurl])
-
-                    # ---- 결과 검증(보강: 생성된 파일을 우선 인정) ----
-                    candidates = [final_path]
-                    if self.last_finished_path:
-                        candidates.append(self.last_finished_path)
-                    neighbor = find_neighbor_output(outdir, os.path.splitext(os.path.basename(final_path))[0])
-                    if neighbor:
-                        candidates.append(neighbor)
-
-                    picked = next((p for p in candidates
-                                   if p and os.path.exists(p) and os.path.getsize(p) > 0), None)
-
-                    if picked:
-                        self.msg_q.put(("done", {"ok": True, "path": picked}))
-                        return
-
-                    # 여기까지 못 찾았으면 다음 단계 시도
-                    raise Exception("다운로드/후처리 후 파일이 확인되지 않았습니다.")
-
-                except Exception as e:
-                    last_err = e
-                    self.msg_q.put(("log", " - 불가, 다음 단계로 진행"))
-
-            raise last_err if last_err else Exception("다운로드 가능한 형식을 찾지 못했습니다.")
+# ---------- 장시간 부하 점검(--soak): 가짜 미디어 서버 + 누수 감시 ----------
+SOAK_SAMPLE_EVERY = 25   # 완료 작업 몇 개마다 지표 기록
+SOAK_SLACK = {           # 워밍업 뒤 전체 구간에서 허용하는 증가(추세선 기준). 로그 줄 수는 상한이 있어 기록만
+    "rss_mb": 48.0, "threads": 4, "fds": 16, "msg_q": 500, "store": 16,
+    "prefetch": 8, "lanes": 8, "disk": 4, "active": 8,
+}
 
-        except Exception as e:
-            self.msg_q.put(("log", f"[에러] {e}\n" + traceback.format_exc(limit=2)))
-            if not IS_FROZEN:
-                self.msg_q.put(("log", "[안내] yt-dlp를 최신으로 업데이트해 보세요:  pip install -U yt-dlp"))
-            else:
-                self.msg_q.put(("log", "[안내] yt-dlp 업데이트가 필요할 수 있습니다. 최신 yt-dlp로 EXE를 재빌드하세요."))
-            self.msg_q.put(("done", {"ok": False, "msg": str(e)}))
+def process_stats() -> dict:
+    """현재 프로세스의 RSS(MB), 스레드 수, 열린 파일/핸들 수(알 수 없으면 None)"""
+    st = {"threads": threading.active_count(), "rss_mb": None, "fds": None}
+    try:
+        import psutil
+        p = psutil.Process()
+        st["rss_mb"] = p.memory_info().rss / 1024 / 1024
+        st["fds"] = p.num_handles() if os.name == "nt" else p.num_fds()
+        return st
+    except Exception:
+        pass
+    try:
+        if os.path.isdir("/proc/self/fd"):
+            st["fds"] = len(os.listdir("/proc/self/fd"))
+            with open("/proc/self/statm") as f:
+                st["rss_mb"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+        elif os.name == "nt":
+            import ctypes
+            from ctypes import wintypes
+
+            class PMC(ctypes.Structure):
+                _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD)] + [
+                    (n, ctypes.c_size_t) for n in ("PeakWorkingSetSize", "WorkingSetSize",
+                                                   "QuotaPeakPagedPoolUsage", "QuotaPagedPoolUsage",
+                                                   "QuotaPeakNonPagedPoolUsage", "QuotaNonPagedPoolUsage",
+                                                   "PagefileUsage", "PeakPagefileUsage")]
+            k32 = ctypes.windll.kernel32
+            proc, pmc, n = k32.GetCurrentProcess(), PMC(), wintypes.DWORD()
+            pmc.cb = ctypes.sizeof(PMC)
+            if k32.K32GetProcessMemoryInfo(proc, ctypes.byref(pmc), pmc.cb):
+                st["rss_mb"] = pmc.WorkingSetSize / 1024 / 1024
+            if k32.GetProcessHandleCount(proc, ctypes.byref(n)):
+                st["fds"] = n.value
+    except Exception:
+        pass
+    return st
+
+class FakeMediaServer:
+    """
+    127.0.0.1에서 Range를 지원하는 가짜 영상 서버. 일부 요청은 일부러 403/지연으로 응답해
+    실패 처리와 청크 헤지 경로도 같이 돌게 함.
+    """
+    def __init__(self, workdir, clips=50, forbid_every=50, stall_every=97, stall_sec=3.0):
+        self.clips = clips
+        self.data = self._make_clip(workdir)
+        self.count = 0
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(body=False)
+
+            def do_GET(self):
+                self.respond(body=True)
+
+            def respond(self, body):
+                with server.lock:
+                    server.count += 1
+                    n = server.count
+                if body and forbid_every and n % forbid_every == 0:
+                    self.send_error(403)
+                    return
+                data, rng = server.data, self.headers.get("Range")
+                start, end, _ = parse_http_range(rng)
+                start, end = start or 0, min(end if end is not None else len(data) - 1, len(data) - 1)
+                self.send_response(206 if rng else 200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                if rng:
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                self.end_headers()
+                if body:
+                    if rng and stall_every and n % stall_every == 0:
+                        time.sleep(stall_sec)
+                    try:
+                        self.wfile.write(data[start:end + 1])
+                    except OSError:
+                        pass   # 헤지에서 진 요청은 클라이언트가 먼저 끊음
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+
+    @staticmethod
+    def _make_clip(workdir):
+        """ffmpeg가 있으면 2초짜리 진짜 mp4(음성 추출/검증까지 통과), 없으면 임의 바이트"""
+        exe = find_ffmpeg_exe(ensure_ffmpeg_on_path())
+        path = os.path.join(workdir, "clip.mp4")
+        if exe:
+            try:
+                subprocess.run([exe, "-y", "-v", "error", "-f", "lavfi", "-i", "testsrc=duration=2:size=320x240:rate=15",
+                                "-f", "lavfi", "-i", "sine=duration=2", "-c:v", "libx264", "-pix_fmt", "yuv420p",
+                                "-c:a", "aac", "-shortest", path], check=True, capture_output=True, timeout=60)
+                with open(path, "rb") as f:
+                    return f.read()
+            except Exception:
+                pass
+        return os.urandom(256 * 1024)
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def url(self, n):
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/v/clip{n % self.clips}.mp4"
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def soak_sample(engine, done, log_lines) -> dict:
+    st = process_stats()
+    st.update(jobs=done, msg_q=engine.msg_q.qsize(), store=len(getattr(engine.store, "jobs", ())),
+              prefetch=len(engine.prefetch.entries), lanes=len(engine.bandwidth.lanes),
+              disk=len(engine.disk.reserved), active=len(engine.active), log=log_lines)
+    return st
+
+def soak_verdict(samples) -> list:
+    """
+    워밍업(앞 1/4)을 뺀 표본의 추세선으로 본 증가량이 여유치를 넘고, 끝 1/3 구간이 가운데 1/3보다
+    여전히 높은(한 번 늘고 멈춘 게 아닌) 지표를 '한없이 증가'로 보고 문제 목록으로 돌려줌.
+    """
+    body = samples[len(samples) // 4:]
+    if len(body) < 6:
+        return [f"표본 부족({len(samples)}개) — 작업 수를 늘리세요"]
+
+    def median(xs):
+        xs = sorted(xs)
+        return (xs[(len(xs) - 1) // 2] + xs[len(xs) // 2]) / 2
+
+    def slope(pts):
+        mx, my = sum(x for x, _ in pts) / len(pts), sum(y for _, y in pts) / len(pts)
+        den = sum((x - mx) ** 2 for x, _ in pts)
+        return sum((x - mx) * (y - my) for x, y in pts) / den if den else 0.0
+
+    third = len(body) // 3
+    mid, last = body[third:2 * third], body[2 * third:]
+    problems = []
+    for key, slack in SOAK_SLACK.items():
+        pts = [(s["jobs"], s[key]) for s in body if s.get(key) is not None]
+        a = [s[key] for s in mid if s.get(key) is not None]
+        b = [s[key] for s in last if s.get(key) is not None]
+        if len(pts) < 6 or not a or not b:
+            continue
+        k = slope(pts)
+        grown = k * (pts[-1][0] - pts[0][0])
+        if grown > max(slack, pts[0][1] * 0.1) and median(b) > median(a):
+            problems.append(f"{key}: {pts[0][1]:.1f} → {pts[-1][1]:.1f} (작업당 {k:+.4f})")
+    return problems
+
+def run_soak(jobs, workers=None):
+    """
+    가짜 미디어 서버를 상대로 합성 작업 jobs개를 엔진에 흘려보내며 RSS/스레드/fd/대기열 크기를 기록.
+    끝나면 soak.csv를 남기고, 한없이 증가하는 지표가 있으면 1(실패)을 돌려줌.
+    """
+    base = tempfile.mkdtemp(prefix="ytdl-soak-")
+    os.environ["APPDATA"] = base   # 설정/기록/캐시를 실제 사용자 폴더와 분리
+    outdir = os.path.join(base, "out")
+    os.makedirs(outdir)
+    server = FakeMediaServer(base).start()
+    engine = DownloadEngine(workers=workers).start()
+    log = deque(maxlen=LOG_MAX_LINES)   # Tk 로그 창 대신(같은 줄 수 상한)
+    samples, submitted, done, ok = [], 0, 0, 0
+    started = time.monotonic()
+    print(f"[부하 점검] 작업 {jobs}개, 동시 {engine.workers}개, 작업 폴더 {base}", flush=True)
+    try:
+        while done < jobs:
+            while submitted < jobs and submitted - done < engine.workers * 2:
+                url = server.url(submitted)
+                if submitted % 3 == 0:
+                    engine.prefetch.request(url)
+                engine.submit(url, outdir, "audio" if submitted % 10 == 9 else "video", "",
+                              ("high", "medium", "low")[submitted % 3], ("high", "normal", "low")[submitted % 3])
+                submitted += 1
+            time.sleep(0.1)   # process_messages와 같은 주기로 비움
+            try:
+                while True:
+                    kind, payload = engine.msg_q.get_nowait()
+                    if kind == "log":
+                        log.append(payload)
+                    elif kind == "done":
+                        done += 1
+                        ok += bool(payload.get("ok"))
+                        try:
+                            if payload.get("path"):
+                                os.remove(payload["path"])
+                        except OSError:
+                            pass
+                        if done % SOAK_SAMPLE_EVERY == 0:
+                            samples.append(soak_sample(engine, done, len(log)))
+                            s = samples[-1]
+                            print(f"[부하 점검] {done}/{jobs} 성공 {ok} | RSS {s['rss_mb'] or 0:.1f}MB"
+                                  f" 스레드 {s['threads']} fd {s['fds']} msg_q {s['msg_q']}"
+                                  f" 대기 {s['store']} | {time.monotonic() - started:.0f}s", flush=True)
+            except queue.Empty:
+                pass
+    except KeyboardInterrupt:
+        print("[부하 점검] 중단됨 — 지금까지의 표본으로 판정", flush=True)
+    finally:
+        server.close()
+    with open(os.path.join(base, "soak.csv"), "w", encoding="utf-8", newline="") as f:
+        keys = list(samples[0]) if samples else []
+        f.write(",".join(keys) + "\n")
+        for s in samples:
+            f.write(",".join("" if s[k] is None else f"{s[k]:.3f}" if isinstance(s[k], float) else str(s[k])
+                             for k in keys) + "\n")
+    problems = soak_verdict(samples)
+    print(f"[부하 점검] 완료 {done}개(성공 {ok}), 기록 {os.path.join(base, 'soak.csv')}")
+    for p in problems:
+        print(f"[부하 점검] 증가 감지 — {p}")
+    print("[부하 점검] 실패" if problems else "[부하 점검] 통과", flush=True)
+    return 1 if problems else 0
+
+# ---------- 분산 작업자(명령줄) ----------
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description="아랑의 Youtube 다운로더")
+    ap.add_argument("--store", help="공유 작업 저장소(SQLite 파일). 여러 PC/프로세스가 같은 대기열을 나눠 처리")
+    ap.add_argument("--worker", action="store_true", help="창 없이 작업자로만 실행(--store 필요)")
+    ap.add_argument("--node", help="작업자 이름(기본: 호스트명-PID)")
+    ap.add_argument("--workers", type=int, help="동시 작업 수")
+    ap.add_argument("--outdir", help="작업의 저장 폴더가 이 PC에 없을 때 쓸 폴더")
+    ap.add_argument("--submit", nargs="+", metavar="URL", help="--store 대기열에 URL을 넣고 종료")
+    ap.add_argument("--mode", choices=("video", "audio"), default="video")
+    ap.add_argument("--res", choices=tuple(FORMAT_PRESETS), default="high")
+    ap.add_argument("--priority", choices=tuple(PRIORITY_RANK), default="normal")
+    ap.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                    help="작업별 프로파일 보고서 기록(기본 폴더: 설정 폴더/profiles). 환경 변수 YTDL_PROFILE도 같음")
+    ap.add_argument("--soak", type=int, metavar="JOBS", help="가짜 미디어 서버로 합성 작업 JOBS개를 돌리며 누수 점검")
+    ap.add_argument("--profile-compare", nargs=2, metavar=("A.json", "B.json"), help="프로파일 보고서 두 개 비교")
+    args = ap.parse_args(argv)
+    if (args.worker or args.submit) and not args.store:
+        ap.error("--worker/--submit에는 --store가 필요합니다.")
+    return args
+
+def submit_jobs(args):
+    store = SQLiteJobStore(args.store)
+    outdir = os.path.abspath(args.outdir or load_last_dir() or os.getcwd())
+    for url in args.submit:
+        if not YOUTUBE_REGEX.search(url):
+            print(f"[건너뜀] YouTube URL이 아님: {url}")
+            continue
+        job = {"url": normalize_youtube_url(url), "outdir": outdir, "mode": args.mode, "filename": "",
+               "res_preset": args.res, "priority": args.priority}
+        print(f"[등록] #{store.put(job, args.priority)} {job['url']} → {outdir}")
+
+def run_worker(args):
+    """창 없는 작업자: 공유 저장소에서 작업을 임대해 처리하고 로그는 콘솔로"""
+    ensure_ffmpeg_on_path()
+    engine = DownloadEngine(workers=args.workers, store=SQLiteJobStore(args.store),
+                            node=args.node, outdir=args.outdir and os.path.abspath(args.outdir)).start()
+    print(f"[작업자] {engine.node} 시작 (동시 {engine.workers}개, 저장소 {args.store})", flush=True)
+    try:
+        while True:
+            kind, payload = engine.msg_q.get()
+            if kind == "log" and not payload.startswith("[진행]"):
+                print(f"[{engine.node}] {payload}", flush=True)
+            elif kind == "done":
+                print(f"[{engine.node}] [완료] {payload.get('path')}" if payload.get("ok")
+                      else f"[{engine.node}] [실패] {payload.get('msg')}", flush=True)
+    except KeyboardInterrupt:
+        # 임대 중이던 작업은 하트비트가 끊겨 LEASE_SEC 뒤 다른 작업자가 회수
+        print(f"[작업자] {engine.node} 종료", flush=True)
 
 def main():
-    app = App()
-    app.mainloop()
+    multiprocessing.freeze_support()   # EXE에서 폴더 일괄 변환(프로세스 풀)용
+    args = parse_args()
+    if args.profile_compare:
+        return profile_compare(*args.profile_compare)
+    prof = args.profile if args.profile is not None else os.environ.get("YTDL_PROFILE")
+    if prof is not None:
+        enable_profiling(None if prof in ("", "1") else prof)
+    if args.soak:
+        sys.exit(run_soak(args.soak, args.workers))
+    if args.submit:
+        submit_jobs(args)
+    elif args.worker:
+        run_worker(args)
+    else:
+        app = App(store=SQLiteJobStore(args.store) if args.store else None)
+        app.mainloop()
 
 if __name__ == "__main__":
     main()